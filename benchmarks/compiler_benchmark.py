@@ -0,0 +1,59 @@
+# EvaluatorWrapper.eval (the Evaluator walking the cached tree) against the same formulas compiled once,
+# on formulas of the kind the GUI accepts.
+# Run from the repository root: python -m benchmarks.compiler_benchmark
+import time
+
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+from expression_processor.numeric_backend import NumericMode
+
+FORMULAS = [
+    "L = 2 * pi * R",
+    "m1 = rho * V * (1 + 0.05 * k) - m0",
+    "Cy1 = Cy0 + Cya * alpha - 0.5 * abs(delta) ^ 2",
+    "S1 = m * g / (rho * V ^ 2 / 2 * Cy)",
+    "l ^ 2 / S > 6 && l ^ 2 / S < 12",
+    "T = sqrt(max(P, 1) / (rho * V)) + ln(1 + exp(-alpha))",
+]
+VARIABLES = {"R": 1.5, "rho": 1.225, "V": 70.0, "k": 3.0, "m0": 12.0, "Cy0": 0.2, "Cya": 5.7, "alpha": 0.1,
+             "delta": -0.2, "m": 1200.0, "g": 9.81, "Cy": 0.9, "l": 11.0, "S": 16.0, "P": 1500.0}
+REPEATS = 2000
+
+
+def best_of(function, rounds=5):
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    for mode in (NumericMode.DECIMAL, NumericMode.FLOAT):
+        ew = EvaluatorWrapper(numeric_mode=mode)
+        ew.bind_all(VARIABLES)
+        compiled = [ew.compile(formula) for formula in FORMULAS]
+        environment = ew.new_environment()
+        for formula, compiled_formula in zip(FORMULAS, compiled):
+            if ew.eval(formula) != ew.eval_compiled(compiled_formula, environment):
+                raise Exception(f"Compiled result differs for '{formula}'")
+
+        def walk_trees():
+            for _ in range(REPEATS):
+                for formula in FORMULAS:
+                    ew.eval(formula)
+
+        def run_compiled():
+            for _ in range(REPEATS):
+                for compiled_formula in compiled:
+                    compiled_formula.eval(environment)
+
+        walked = best_of(walk_trees)
+        fast = best_of(run_compiled)
+        evaluations = REPEATS * len(FORMULAS)
+        print(f"{mode.name:8} tree walk {evaluations / walked:10.0f}/s  compiled {evaluations / fast:10.0f}/s  "
+              f"speedup {walked / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
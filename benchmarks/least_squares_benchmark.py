@@ -0,0 +1,51 @@
+# solve_least_squares with every method on dense and sparse designs of 10 to 1000 terms: time, error of the
+# coefficients and the method that "auto" picks, to reproduce and re-tune its thresholds.
+# Run from the repository root: python -m benchmarks.least_squares_benchmark [max_terms]
+import sys
+import time
+
+import numpy as np
+from scipy import sparse
+
+from samples_processor.least_squares import solve_least_squares
+
+TERMS = (10, 30, 100, 300, 1000)
+METHODS = ("qr", "cholesky", "lsqr", "auto")
+# Non-zeros per row of the sparse designs, as in one-hot or interaction terms
+SPARSE_DENSITY = 0.01
+
+
+def make_problem(rows, terms, density, rng):
+    if density is None:
+        x = rng.normal(size=(rows, terms))
+    else:
+        x = sparse.random(rows, terms, density=density, format="csr", random_state=rng,
+                          data_rvs=lambda size: rng.normal(size=size))
+    coefficients = rng.normal(size=terms)
+    y = x @ coefficients + 3.0 + 1e-6 * rng.normal(size=rows)
+    return x, y, coefficients
+
+
+def main():
+    max_terms = int(sys.argv[1]) if len(sys.argv) > 1 else TERMS[-1]
+    rng = np.random.default_rng(0)
+    print(f"{'design':7} {'terms':>5} {'rows':>6}  " +
+          "  ".join(f"{method:>22}" for method in METHODS))
+    for design, density in (("dense", None), ("sparse", SPARSE_DENSITY)):
+        for terms in TERMS:
+            if terms > max_terms:
+                break
+            rows = 10 * terms + 2000
+            x, y, expected = make_problem(rows, terms, density, rng)
+            cells = []
+            for method in METHODS:
+                started = time.perf_counter()
+                solution = solve_least_squares(x, y, method=method)
+                elapsed = time.perf_counter() - started
+                error = np.max(np.abs(solution.coefficients - expected))
+                cells.append(f"{elapsed:7.3f} s {error:7.1e} {solution.method[:4]:>4}")
+            print(f"{design:7} {terms:5} {rows:6}  " + "  ".join(f"{cell:>22}" for cell in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Expressionizer (recursive descent) against PrecedenceExpressionizer on flat models of 1k, 10k and 100k terms.
+# Both must build the same tree; the time per term of the precedence parser should stay flat as the model grows.
+# Run from the repository root: python -m benchmarks.parser_benchmark
+import time
+
+from expression_processor.expressionizer import Expressionizer, AssignExpression, CallExpression, \
+    LiteralExpression, VariableExpression, children
+from expression_processor.precedence_parser import PrecedenceExpressionizer
+from expression_processor.tokenizer import FastTokenizer
+
+SIZES = (1000, 10000, 100000)
+TERMS = ["a{i} * x{i} ^ 2", "sqrt(y{i}) / (1 + b{i})", "-c{i} * (z{i} - 0.5)"]
+
+
+def make_model(terms):
+    return "M = " + " + ".join(TERMS[i % len(TERMS)].format(i=i % 1000) for i in range(terms))
+
+
+def same_tree(first, second):
+    # Iterative, the trees of long chains are far deeper than the recursion limit
+    stack = [(first, second)]
+    while stack:
+        left, right = stack.pop()
+        if type(left) is not type(right):
+            return False
+        if isinstance(left, LiteralExpression) and left.value != right.value:
+            return False
+        if isinstance(left, (VariableExpression, AssignExpression)) and left.name.lexeme != right.name.lexeme:
+            return False
+        if isinstance(left, CallExpression) and left.name != right.name:
+            return False
+        operator = getattr(left, "operator", None)
+        if operator is not None and operator.type != right.operator.type:
+            return False
+        left_children = children(left)
+        right_children = children(right)
+        if len(left_children) != len(right_children):
+            return False
+        stack.extend(zip(left_children, right_children))
+    return True
+
+
+def parse(parser, tokens):
+    started = time.perf_counter()
+    tree = parser(tokens).parse_expression()
+    return tree, time.perf_counter() - started
+
+
+def main():
+    for terms in SIZES:
+        tokens = FastTokenizer(make_model(terms)).parse_tokens()
+        fast_tree, fast = parse(PrecedenceExpressionizer, tokens)
+        try:
+            slow_tree, slow = parse(Expressionizer, tokens)
+        except RecursionError:
+            slow_tree = None
+        if slow_tree is not None and not same_tree(slow_tree, fast_tree):
+            raise Exception(f"Trees differ at {terms} terms")
+        recursive = f"{slow:7.3f} s {slow / terms * 1e6:6.1f} us/term" if slow_tree is not None \
+            else "recursion limit"
+        print(f"{terms:7} terms  Expressionizer {recursive}  "
+              f"PrecedenceExpressionizer {fast:7.3f} s {fast / terms * 1e6:6.1f} us/term")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Tokenizer against FastTokenizer on a generated model of several megabytes with identifiers, numbers in
+# scientific notation, comparisons and the √ operator. Both must produce the same token stream.
+# Run from the repository root: python -m benchmarks.tokenizer_benchmark [megabytes]
+import random
+import sys
+import time
+
+from expression_processor.tokenizer import Tokenizer, FastTokenizer
+
+TERMS = [
+    "{a} * x{i} ^ 2",
+    "√(y{i} + {b})",
+    "{a}e-3 * ln(z{i})",
+    "max(w{i}, {b}E+2) / (1 + k_{i}.v)",
+    "(t{i} >= {a}) && (t{i} != {b})",
+]
+
+
+def make_model(megabytes, seed=0):
+    rng = random.Random(seed)
+    parts = ["M ="]
+    size = 0
+    i = 0
+    while size < megabytes * 1024 * 1024:
+        term = rng.choice(TERMS).format(i=i % 1000, a=round(rng.uniform(0, 100), 3), b=rng.randint(1, 999))
+        parts.append(term)
+        size += len(term) + 3
+        i += 1
+    return " + ".join(parts)
+
+
+def tokenize(tokenizer, source):
+    started = time.perf_counter()
+    tokens = tokenizer(source).parse_tokens()
+    return tokens, time.perf_counter() - started
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    source = make_model(megabytes)
+    slow_tokens, slow = tokenize(Tokenizer, source)
+    fast_tokens, fast = tokenize(FastTokenizer, source)
+    if [(t.type, t.lexeme, t.literal) for t in slow_tokens] != [(t.type, t.lexeme, t.literal) for t in fast_tokens]:
+        raise Exception("Token streams differ")
+    size = len(source.encode("utf-8")) / 1024 / 1024
+    print(f"{size:.1f} MB, {len(fast_tokens)} tokens")
+    print(f"Tokenizer     {slow:7.2f} s  {size / slow:6.2f} MB/s")
+    print(f"FastTokenizer {fast:7.2f} s  {size / fast:6.2f} MB/s  speedup {slow / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Rows per second of the feature transform of fit_mnk: transform_samples on whole columns against the
+# terms evaluated row by row with the scalar evaluator, as fun_mnk used to do it.
+# Run from the repository root: python -m benchmarks.transform_benchmark [rows]
+import sys
+import time
+
+import numpy as np
+
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+from samples_processor.formula_processing import Main
+from samples_processor.samples_processing import match_terms, transform_samples
+
+EXPRESSION = "y = a0 * x1 ^ 2 + a1 * sqrt(x2) + a2 / x3 + a3"
+PARAMS_ORDER = ["x1", "x2", "x3"]
+# The row-by-row path is slow, it only runs on the first rows
+SCALAR_ROWS = 2000
+
+
+def transform_by_rows(x_list, actions_list, ew):
+    transformed = np.array(x_list, dtype=np.float64)
+    for row in range(len(x_list)):
+        ew.bind_all({PARAMS_ORDER[i]: float(x_list[row, i]) for i in range(len(PARAMS_ORDER))})
+        for param, tokens in actions_list:
+            transformed[row, PARAMS_ORDER.index(param)] = float(ew.eval_tokens(tokens))
+    return transformed
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    x_list = np.random.default_rng(0).uniform(1, 10, size=(rows, len(PARAMS_ORDER)))
+    actions_list, _ = match_terms(PARAMS_ORDER, Main().process_mnk(EXPRESSION))
+    ew = EvaluatorWrapper()
+
+    started = time.perf_counter()
+    transformed = transform_samples(x_list, PARAMS_ORDER, actions_list, ew)
+    vectorized = time.perf_counter() - started
+
+    scalar_rows = min(rows, SCALAR_ROWS)
+    started = time.perf_counter()
+    by_rows = transform_by_rows(x_list[:scalar_rows], actions_list, ew)
+    scalar = time.perf_counter() - started
+    if not np.allclose(transformed[:scalar_rows], by_rows, rtol=1e-12):
+        raise Exception("Vectorized transform differs from the row-by-row one")
+
+    print(f"row by row  {scalar_rows / scalar:12.0f} rows/s ({scalar_rows} rows)")
+    print(f"vectorized  {rows / vectorized:12.0f} rows/s ({rows} rows)  "
+          f"speedup {(rows / vectorized) / (scalar_rows / scalar):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+from expression_processor.expressionizer import ExpressionSolver
+from expression_processor.tokenizer import TokenType
+
+
+# (Expression -> Python closure) processor
+# Produces the same values as Evaluator in its numeric mode, but the tree is walked only once: operator dispatch,
+# function lookup and variable name resolution all happen at compile time.
+class ExpressionCompiler(ExpressionSolver):
+    def __init__(self, evaluator):
+        self.__functions = evaluator.get_functions()
+        self.__backend = evaluator.backend
+        self.__slots = {}
+        self.__slot_names = []
+        self.__assigned = set()
+
+    def compile(self, expr):
+        self.__slots = {}
+        self.__slot_names = []
+        self.__assigned = set()
+        function = expr.accept(self)
+        assigned = tuple(sorted(self.__assigned))
+        return CompiledExpression(function, tuple(self.__slot_names), assigned)
+
+    def __slot(self, name):
+        name = name.lower()
+        index = self.__slots.get(name)
+        if index is None:
+            index = len(self.__slot_names)
+            self.__slots[name] = index
+            self.__slot_names.append(name)
+        return index
+
+    def visit_assign_expr(self, expr):
+        value = expr.value.accept(self)
+        index = self.__slot(expr.name.lexeme)
+        self.__assigned.add(index)
+
+        def assign(frame):
+            result = value(frame)
+            frame[index] = result
+            return result
+
+        return assign
+
+    def visit_logical_expr(self, expr):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        zero = self.__backend.zero
+        one = self.__backend.one
+
+        if expr.operator.type == TokenType.LOGICAL_OR:
+            def logical_or(frame):
+                if left(frame) != zero:
+                    return one
+                return zero if right(frame) == zero else one
+
+            return logical_or
+        elif expr.operator.type == TokenType.LOGICAL_AND:
+            def logical_and(frame):
+                if left(frame) == zero:
+                    return zero
+                return zero if right(frame) == zero else one
+
+            return logical_and
+        else:
+            raise Exception(f"Invalid logical operator '{expr.operator.lexeme}'")
+
+    def visit_binary_expr(self, expr):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+
+        backend = self.__backend
+        zero = backend.zero
+        one = backend.one
+
+        match expr.operator.type:
+            case TokenType.PLUS:
+                add = backend.add
+                return lambda frame: add(left(frame), right(frame))
+            case TokenType.MINUS:
+                subtract = backend.subtract
+                return lambda frame: subtract(left(frame), right(frame))
+            case TokenType.STAR:
+                multiply = backend.multiply
+                return lambda frame: multiply(left(frame), right(frame))
+            case TokenType.SLASH:
+                divide = backend.divide
+                return lambda frame: divide(left(frame), right(frame))
+            case TokenType.MODULO:
+                remainder = backend.remainder
+                return lambda frame: remainder(left(frame), right(frame))
+            case TokenType.EXPONENT:
+                power = backend.power
+                return lambda frame: power(left(frame), right(frame))
+            case TokenType.EQUAL:
+                return lambda frame: one if left(frame) == right(frame) else zero
+            case TokenType.NOT_EQUAL:
+                return lambda frame: one if left(frame) != right(frame) else zero
+            case TokenType.GREATER:
+                return lambda frame: one if left(frame) > right(frame) else zero
+            case TokenType.GREATER_EQUAL:
+                return lambda frame: one if left(frame) >= right(frame) else zero
+            case TokenType.LESS:
+                return lambda frame: one if left(frame) < right(frame) else zero
+            case TokenType.LESS_EQUAL:
+                return lambda frame: one if left(frame) <= right(frame) else zero
+            case _:
+                raise Exception(f"Invalid binary operator '{expr.operator.lexeme}'")
+
+    def visit_unary_expr(self, expr):
+        right = expr.right.accept(self)
+
+        match expr.operator.type:
+            case TokenType.MINUS:
+                negate = self.__backend.negate
+                return lambda frame: negate(right(frame))
+            case TokenType.SQUARE_ROOT:
+                sqrt = self.__backend.sqrt
+                return lambda frame: sqrt(right(frame))
+            case _:
+                raise Exception("Invalid unary operator")
+
+    def visit_call_expr(self, expr):
+        name = expr.name
+        function = self.__functions.get(name.lower())
+        if function is None:
+            raise Exception(f"Undefined function '{name}'")
+        call = self.__backend.call
+        arguments = tuple(arg.accept(self) for arg in expr.arguments)
+        return lambda frame: call(function, [arg(frame) for arg in arguments])
+
+    def visit_literal_expr(self, expr):
+        value = self.__backend.number(expr.value)
+        return lambda frame: value
+
+    def visit_variable_expr(self, expr):
+        name = expr.name.lexeme
+        index = self.__slot(name)
+
+        def variable(frame):
+            value = frame[index]
+            if value is None:
+                raise Exception(f"Undefined variable '{name}'")
+            return value
+
+        return variable
+
+    def visit_grouping_expr(self, expr):
+        return expr.expression.accept(self)
+
+    def visit_shared_expr(self, expr):
+        value = expr.expression.accept(self)
+        # '#' can not appear in an identifier, so the slot never clashes with a variable
+        index = self.__slot("#shared" + str(expr.index))
+
+        def shared(frame):
+            result = frame[index]
+            if result is None:
+                result = value(frame)
+                frame[index] = result
+            return result
+
+        return shared
+
+    def visit_optimized_expr(self, expr):
+        return expr.expression.accept(self)
+
+
+# Immutable once compiled: all per-call state lives in the frame list created by eval, so one
+# CompiledExpression can be evaluated from many threads at once as long as each call gets its own variables
+class CompiledExpression:
+    __slots__ = ("function", "slot_names", "assigned_slots")
+
+    def __init__(self, function, slot_names, assigned_slots):
+        object.__setattr__(self, "function", function)
+        object.__setattr__(self, "slot_names", slot_names)
+        object.__setattr__(self, "assigned_slots", assigned_slots)
+
+    def __setattr__(self, name, value):
+        raise Exception("CompiledExpression is immutable")
+
+    # Variables are read from (and assignments written back to) a dict with lower-case keys,
+    # the same layout as Evaluator.get_variables()
+    def eval(self, variables):
+        frame = [variables.get(name) for name in self.slot_names]
+        result = self.function(frame)
+        for index in self.assigned_slots:
+            # An assignment skipped by && or || leaves its slot as it was, None for an undefined variable
+            if frame[index] is not None:
+                variables[self.slot_names[index]] = frame[index]
+        return result
@@ -0,0 +1,181 @@
+from expression_processor.expressionizer import ExpressionSolver, BinaryExpression, UnaryExpression, \
+    CallExpression, LiteralExpression
+from expression_processor.tokenizer import Token, TokenType
+
+_PLUS = Token(TokenType.PLUS, "+", None)
+_MINUS = Token(TokenType.MINUS, "-", None)
+_STAR = Token(TokenType.STAR, "*", None)
+_SLASH = Token(TokenType.SLASH, "/", None)
+_EXPONENT = Token(TokenType.EXPONENT, "^", None)
+
+
+# (Expression -> Expression) processor
+# Builds the partial derivative of an expression with respect to one variable. Products with 0 and 1 and
+# sums with 0 are simplified on the fly, so derivatives of unrelated subtrees collapse to the literal 0.
+# Comparisons, logical operators and floor/ceil/round are piecewise constant and get the derivative 0.
+class Differentiator(ExpressionSolver):
+    def __init__(self, variable):
+        self.variable = variable.lower()
+
+    def derivative(self, expr):
+        return expr.accept(self)
+
+    def visit_assign_expr(self, expr):
+        raise Exception(f"Cannot differentiate assignment to '{expr.name.lexeme}'")
+
+    def visit_logical_expr(self, expr):
+        return _literal(0)
+
+    def visit_binary_expr(self, expr):
+        left = expr.left
+        right = expr.right
+        match expr.operator.type:
+            case TokenType.PLUS:
+                return _add(self.derivative(left), self.derivative(right))
+            case TokenType.MINUS:
+                return _subtract(self.derivative(left), self.derivative(right))
+            case TokenType.STAR:
+                return _add(_multiply(self.derivative(left), right), _multiply(left, self.derivative(right)))
+            case TokenType.SLASH:
+                # (u / v)' = u' / v - u * v' / v^2
+                return _subtract(_divide(self.derivative(left), right),
+                                 _divide(_multiply(left, self.derivative(right)), _power(right, _literal(2))))
+            case TokenType.EXPONENT:
+                d_left = self.derivative(left)
+                d_right = self.derivative(right)
+                if _is_zero(d_right):
+                    # (u^n)' = n * u^(n - 1) * u'
+                    return _multiply(_multiply(right, _power(left, _subtract(right, _literal(1)))), d_left)
+                # (u^v)' = u^v * (v' * ln(u) + v * u' / u)
+                return _multiply(expr, _add(_multiply(d_right, _call("ln", left)),
+                                            _divide(_multiply(right, d_left), left)))
+            case TokenType.MODULO:
+                if _is_zero(self.derivative(right)):
+                    # Piecewise u - k * v with constant k
+                    return self.derivative(left)
+                raise Exception("Cannot differentiate '%' with a variable divisor")
+            case _:
+                # Comparisons
+                return _literal(0)
+
+    def visit_unary_expr(self, expr):
+        d_right = self.derivative(expr.right)
+        match expr.operator.type:
+            case TokenType.MINUS:
+                return _negate(d_right)
+            case TokenType.SQUARE_ROOT:
+                return _divide(d_right, _multiply(_literal(2), expr))
+            case _:
+                raise Exception("Invalid unary operator")
+
+    def visit_call_expr(self, expr):
+        name = expr.name.lower()
+        arguments = expr.arguments
+        match name:
+            case "sum":
+                result = _literal(0)
+                for arg in arguments:
+                    result = _add(result, self.derivative(arg))
+                return result
+            case "floor" | "ceil" | "round":
+                return _literal(0)
+        if len(arguments) != 1:
+            raise Exception(f"Cannot differentiate function '{expr.name}'")
+        argument = arguments[0]
+        d_argument = self.derivative(argument)
+        if _is_zero(d_argument):
+            return d_argument
+        match name:
+            case "sqrt":
+                return _divide(d_argument, _multiply(_literal(2), expr))
+            case "abs":
+                return _multiply(_divide(argument, expr), d_argument)
+            case "ln":
+                return _divide(d_argument, argument)
+            case "exp":
+                return _multiply(expr, d_argument)
+            case _:
+                raise Exception(f"Cannot differentiate function '{expr.name}'")
+
+    def visit_literal_expr(self, expr):
+        return _literal(0)
+
+    def visit_variable_expr(self, expr):
+        return _literal(1 if expr.name.lexeme.lower() == self.variable else 0)
+
+    def visit_grouping_expr(self, expr):
+        return self.derivative(expr.expression)
+
+    def visit_shared_expr(self, expr):
+        return self.derivative(expr.expression)
+
+    def visit_optimized_expr(self, expr):
+        return self.derivative(expr.expression)
+
+
+def _literal(value):
+    return LiteralExpression(float(value))
+
+
+def _is_literal(expr, value):
+    return isinstance(expr, LiteralExpression) and expr.value == value
+
+
+def _is_zero(expr):
+    return _is_literal(expr, 0)
+
+
+def _add(left, right):
+    if isinstance(left, LiteralExpression) and isinstance(right, LiteralExpression):
+        return _literal(float(left.value) + float(right.value))
+    if _is_zero(left):
+        return right
+    if _is_zero(right):
+        return left
+    return BinaryExpression(left, _PLUS, right)
+
+
+def _subtract(left, right):
+    if isinstance(left, LiteralExpression) and isinstance(right, LiteralExpression):
+        return _literal(float(left.value) - float(right.value))
+    if _is_zero(right):
+        return left
+    if _is_zero(left):
+        return _negate(right)
+    return BinaryExpression(left, _MINUS, right)
+
+
+def _multiply(left, right):
+    if isinstance(left, LiteralExpression) and isinstance(right, LiteralExpression):
+        return _literal(float(left.value) * float(right.value))
+    if _is_zero(left) or _is_zero(right):
+        return _literal(0)
+    if _is_literal(left, 1):
+        return right
+    if _is_literal(right, 1):
+        return left
+    return BinaryExpression(left, _STAR, right)
+
+
+def _divide(left, right):
+    if _is_zero(left):
+        return _literal(0)
+    if _is_literal(right, 1):
+        return left
+    return BinaryExpression(left, _SLASH, right)
+
+
+def _power(left, right):
+    if _is_literal(right, 1):
+        return left
+    return BinaryExpression(left, _EXPONENT, right)
+
+
+def _negate(right):
+    if _is_zero(right):
+        return right
+    return UnaryExpression(_MINUS, right)
+
+
+def _call(name, argument):
+    return CallExpression(name, [argument])
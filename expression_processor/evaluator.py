@@ -1,29 +1,51 @@
-from decimal import Decimal, getcontext, ROUND_HALF_UP, ROUND_FLOOR, ROUND_CEILING
-import math
+from decimal import Context
 
 from expression_processor.expressionizer import ExpressionSolver
 from expression_processor.expressionizer import Expression
+from expression_processor.numeric_backend import NumericMode, make_backend
 from expression_processor.tokenizer import TokenType
 
 
 # (Expression -> BigDecimal / Float) processor
 class Evaluator(ExpressionSolver):
-    def __init__(self):
-        self.math_context = getcontext()
-        self.math_context.prec = 16
+    def __init__(self, numeric_mode=NumericMode.DECIMAL, math_context=None):
+        # Each evaluator owns its context, the global decimal context of the thread is left alone
+        if math_context is None:
+            math_context = Context(prec=16)
+        self.math_context = math_context
+        self.backend = make_backend(numeric_mode, self.math_context)
         self.__variables = {}
         self.__functions = {}
+        self.__shared_values = []
+
+    def get_numeric_mode(self):
+        return self.backend.mode
 
     def get_variables(self):
         return self.__variables
 
     def __define_variable(self, name, value):
-        self.__variables[name.lower()] = value
+        self.__variables[name.lower()] = self.backend.number(value)
+
+    # Stores an already computed value without building an expression for it
+    def define_value(self, name, value):
+        self.__define_variable(name, value)
+        return self
+
+    def define_values(self, values):
+        variables = self.__variables
+        number = self.backend.number
+        for name, value in values.items():
+            variables[name.lower()] = number(value)
+        return self
 
     def define_expr(self, name, expr):
         self.__define_variable(name, self.eval(expr))
         return self
 
+    def get_functions(self):
+        return self.__functions
+
     def add_function(self, name, function):
         self.__functions[name.lower()] = function
         return self
@@ -43,13 +65,13 @@ class Evaluator(ExpressionSolver):
         if expr.operator.type == TokenType.LOGICAL_OR:
             lv = self.eval(left)
             if (self.is_truthy(lv)):
-                return Decimal(1)
-            return Decimal(self.is_truthy(self.eval(right)))
+                return self.backend.one
+            return self.backend.boolean(self.is_truthy(self.eval(right)))
         elif expr.operator.type == TokenType.LOGICAL_AND:
             lv = self.eval(left)
             if (not self.is_truthy(lv)):
-                return Decimal(0)
-            return Decimal(self.is_truthy(self.eval(right)))
+                return self.backend.zero
+            return self.backend.boolean(self.is_truthy(self.eval(right)))
         else:
             raise Exception(f"Invalid logical operator '{expr.operator.lexeme}'")
 
@@ -57,32 +79,32 @@ class Evaluator(ExpressionSolver):
         left = self.eval(expr.left)
         right = self.eval(expr.right)
 
+        backend = self.backend
         match expr.operator.type:
             case TokenType.PLUS:
-                return Decimal(left) + Decimal(right)
+                return backend.add(left, right)
             case TokenType.MINUS:
-                return Decimal(left) - Decimal(right)
+                return backend.subtract(left, right)
             case TokenType.STAR:
-                return Decimal(left) * Decimal(right)
+                return backend.multiply(left, right)
             case TokenType.SLASH:
-                return Decimal(left) / Decimal(right)
+                return backend.divide(left, right)
             case TokenType.MODULO:
-                return Decimal(left) % Decimal(right)
+                return backend.remainder(left, right)
             case TokenType.EXPONENT:
-                # Fix bug so float and bigdecimal doesn't work together
                 return self.pow(left, right)
             case TokenType.EQUAL:
-                return Decimal(left == right)
+                return backend.boolean(left == right)
             case TokenType.NOT_EQUAL:
-                return Decimal(left != right)
+                return backend.boolean(left != right)
             case TokenType.GREATER:
-                return Decimal(left > right)
+                return backend.boolean(left > right)
             case TokenType.GREATER_EQUAL:
-                return Decimal(left >= right)
+                return backend.boolean(left >= right)
             case TokenType.LESS:
-                return Decimal(left < right)
+                return backend.boolean(left < right)
             case TokenType.LESS_EQUAL:
-                return Decimal(left <= right)
+                return backend.boolean(left <= right)
             case _:
                 raise Exception(f"Invalid binary operator '{expr.operator.lexeme}'")
 
@@ -91,9 +113,9 @@ class Evaluator(ExpressionSolver):
 
         match expr.operator.type:
             case TokenType.MINUS:
-                return -right
+                return self.backend.negate(right)
             case TokenType.SQUARE_ROOT:
-                return math.sqrt(right)
+                return self.backend.sqrt(right)
             case _:
                 raise Exception("Invalid unary operator")
 
@@ -103,10 +125,10 @@ class Evaluator(ExpressionSolver):
         if function is None:
             raise Exception(f"Undefined function '{name}'")
         # Evaluate every argument then call funciton
-        return function.call([self.eval(arg) for arg in expr.arguments])
+        return self.backend.call(function, [self.eval(arg) for arg in expr.arguments])
 
     def visit_literal_expr(self, expr):
-        return expr.value
+        return self.backend.number(expr.value)
 
     def visit_variable_expr(self, expr):
         name = expr.name.lexeme
@@ -118,32 +140,40 @@ class Evaluator(ExpressionSolver):
     def visit_grouping_expr(self, expr):
         return self.eval(expr.expression)
 
+    def visit_shared_expr(self, expr):
+        value = self.__shared_values[expr.index]
+        if value is None:
+            value = self.eval(expr.expression)
+            self.__shared_values[expr.index] = value
+        return value
+
+    def visit_optimized_expr(self, expr):
+        # Shared values live for one evaluation of the optimized expression
+        outer_values = self.__shared_values
+        self.__shared_values = [None] * expr.shared_count
+        try:
+            return self.eval(expr.expression)
+        finally:
+            self.__shared_values = outer_values
+
     def or_(self, left, right):
         left_val = self.eval(left)
         if self.is_truthy(left_val):
-            return Decimal(1)
-        return Decimal(self.is_truthy(self.eval(right)))
+            return self.backend.one
+        return self.backend.boolean(self.is_truthy(self.eval(right)))
 
     def and_(self, left, right):
         left_val = self.eval(left)
         if not self.is_truthy(left_val):
-            return Decimal(0)
-        return Decimal(self.is_truthy(self.eval(right)))
+            return self.backend.zero
+        return self.backend.boolean(self.is_truthy(self.eval(right)))
 
     def is_truthy(self, value):
-        return value != Decimal(0)
+        return value != self.backend.zero
 
+    # Decimal mode computes the power at math_context.prec digits, float mode uses math.pow
     def pow(self, base, exp):
-        sign_of_exp = int(exp / abs(exp))
-        exp = abs(exp)
-        int_part = int(exp)
-        frac_part = exp - int_part
-        int_pow = base ** int_part
-        frac_pow = Decimal(math.pow(float(base), float(frac_part)))
-        result = Decimal(int_pow) * frac_pow
-        if sign_of_exp == -1:
-            result = Decimal(1) / result
-        return result
+        return self.backend.power(base, exp)
 
 
 class Function:
@@ -2,26 +2,46 @@
 # Это адаптация на языке Python следующего проекта: ExprK (https://github.com/Keelar/ExprK)
 # author: leonidsah
 import math
+import numbers
 from decimal import ROUND_FLOOR, ROUND_CEILING, Decimal
 
+from expression_processor.compiler import ExpressionCompiler
 from expression_processor.evaluator import Evaluator, Function
-from expression_processor.expressionizer import Expressionizer
-from expression_processor.tokenizer import Tokenizer
+from expression_processor.expression_cache import ExpressionCache
+from expression_processor.expressionizer import Expression, OptimizedExpression
+from expression_processor.numeric_backend import NumericMode
+from expression_processor.optimizer import ExpressionOptimizer
+from expression_processor.precedence_parser import ParserMode, make_expressionizer
+from expression_processor.tokenizer import Tokenizer, FastTokenizer
 
 
 class EvaluatorWrapper:
-    def __init__(self):
-        self.__evaluator = Evaluator()
+    # Variables that the optimizer may fold into literals
+    __constant_names = ("pi", "e")
+
+    # balance_chains rebuilds long a + b + ... and a * b * ... chains as balanced trees, so evaluating them
+    # needs little stack; it requires ParserMode.PRECEDENCE
+    def __init__(self, cache_size=256, numeric_mode=NumericMode.DECIMAL, optimize=False,
+                 parser_mode=ParserMode.RECURSIVE, fast_tokenizer=True, balance_chains=False):
+        self.__evaluator = Evaluator(numeric_mode)
+        self.__cache = ExpressionCache(cache_size)
+        self.__optimize = optimize
+        self.__parser_mode = parser_mode
+        self.__balance_chains = balance_chains
+        self.__tokenizer = FastTokenizer if fast_tokenizer else Tokenizer
+        self.__pure_functions = {}
         self.define("pi", math.pi)
         self.define("e", math.e)
-        self.__evaluator.add_function("abs", AbsFunction())
-        self.__evaluator.add_function("sum", SumFunction())
-        self.__evaluator.add_function("floor", FloorFunction())
-        self.__evaluator.add_function("ceil", CeilFunction())
-        self.__evaluator.add_function("round", RoundFunction())
-        self.__evaluator.add_function("min", MinFunction())
-        self.__evaluator.add_function("max", MaxFunction())
-        self.__evaluator.add_function("sqrt", SqrtFunction())
+        self.__add_builtin_function("abs", AbsFunction())
+        self.__add_builtin_function("sum", SumFunction())
+        self.__add_builtin_function("floor", FloorFunction())
+        self.__add_builtin_function("ceil", CeilFunction())
+        self.__add_builtin_function("round", RoundFunction())
+        self.__add_builtin_function("min", MinFunction())
+        self.__add_builtin_function("max", MaxFunction())
+        self.__add_builtin_function("sqrt", SqrtFunction())
+        self.__add_builtin_function("ln", LnFunction())
+        self.__add_builtin_function("exp", ExpFunction())
 
         self.precision = self.__evaluator.math_context.prec
         self.roundingMode = self.__evaluator.math_context.rounding
@@ -34,43 +54,164 @@ class EvaluatorWrapper:
         self.__evaluator.math_context.rounding = rounding_mode
         return self
 
+    def get_numeric_mode(self):
+        return self.__evaluator.get_numeric_mode()
+
     def define(self, name: str, expression: str):
+        if isinstance(expression, (Decimal, numbers.Real)):
+            return self.bind(name, expression)
         expr = self.__parse_string_to_expression(str(expression))
-        self.__evaluator.define_expr(name, expr)
+        self.__evaluator.define_value(name, self.__evaluate(expr))
+        self.__check_constants([name])
+        return self
+
+    # Numeric fast path of define: the value goes straight into the variable table
+    def bind(self, name: str, value):
+        self.__evaluator.define_value(name, self.__to_number(name, value))
+        self.__check_constants([name])
+        return self
+
+    def bind_all(self, bindings: dict):
+        self.__evaluator.define_values({name: self.__to_number(name, value) for name, value in bindings.items()})
+        self.__check_constants(bindings)
         return self
 
     def add_function(self, name: str, func: Function):
         self.__evaluator.add_function(name, func)
+        # A user function may replace a built-in one, so it is no longer safe to fold it
+        if self.__pure_functions.pop(name.lower(), None) is not None and self.__optimize:
+            self.__cache.invalidate()
+
+    def __add_builtin_function(self, name: str, func: Function):
+        self.__evaluator.add_function(name, func)
+        self.__pure_functions[name] = func
+
+    # Returns the optimized tree of an expression; its removed_nodes tells how many nodes the pass saved
+    def optimize(self, expression: str) -> OptimizedExpression:
+        return self.__make_optimizer().optimize(self.__parse_without_optimization(expression))
+
+    def __make_optimizer(self):
+        variables = self.get_variables()
+        constants = {name: variables[name] for name in self.__constant_names if name in variables}
+        return ExpressionOptimizer(self.__evaluator, constants, self.__pure_functions)
+
+    # Optimized trees have the constants folded in, so they are dropped when a constant changes
+    def __check_constants(self, names):
+        if self.__optimize and any(name.lower() in self.__constant_names for name in names):
+            self.__cache.invalidate()
+
+    def set_cache_size(self, cache_size):
+        self.__cache.set_max_size(cache_size)
+        return self
+
+    # Forget the parsed tree of one expression, or of all expressions if none is given
+    def invalidate_cache(self, expression: str = None):
+        self.__cache.invalidate(expression)
+        return self
+
+    def get_cache_stats(self):
+        return self.__cache.stats()
 
     def eval(self, expression: str) -> Decimal:
-        return self.__evaluator.eval(self.__parse_string_to_expression(expression))
+        return self.__evaluate(self.__parse_string_to_expression(expression))
+
+    def __evaluate(self, expr):
+        result = self.__evaluator.eval(expr)
+        if isinstance(expr, OptimizedExpression):
+            self.__check_constants(expr.assigned_names)
+        return result
+
+    # Tree of an expression, taken from the cache when it has been parsed before
+    def parse(self, expression: str):
+        return self.__parse_string_to_expression(expression)
+
+    # Parses (through the cache) and compiles an expression into a CompiledExpression; an already
+    # parsed tree is compiled as it is
+    def compile(self, expression):
+        expr = expression if isinstance(expression, Expression) else self.__parse_string_to_expression(expression)
+        return ExpressionCompiler(self.__evaluator).compile(expr)
+
+    def eval_compiled(self, compiled, environment=None):
+        if environment is None:
+            environment = self.__evaluator.get_variables()
+        return compiled.eval(environment)
+
+    # Private copy of the variables of this wrapper with extra bindings on top. Concurrent evaluations of
+    # compiled expressions each get their own environment, so assignments do not leak between them.
+    def new_environment(self, bindings: dict = None):
+        environment = dict(self.__evaluator.get_variables())
+        if bindings:
+            number = self.__evaluator.backend.number
+            for name, value in bindings.items():
+                environment[name.lower()] = number(self.__to_number(name, value))
+        return environment
+
+    # Evaluates an expression over columns of bindings (name -> array); scalar variables of
+    # this wrapper, such as pi and e, are broadcast
+    def eval_vectorized(self, expression: str, columns: dict):
+        return self.__eval_vectorized(self.__parse_string_to_expression(expression), columns)
+
+    def eval_tokens_vectorized(self, tokens, columns: dict):
+        return self.__make_vector_evaluator(columns).eval(self.__parse_tokens_to_expression(tokens))
+
+    # Several token lists over the same columns, which are bound only once
+    def eval_all_tokens_vectorized(self, token_lists, columns: dict):
+        evaluator = self.__make_vector_evaluator(columns)
+        return [evaluator.eval(self.__parse_tokens_to_expression(tokens)) for tokens in token_lists]
+
+    def __eval_vectorized(self, expr, columns):
+        return self.__make_vector_evaluator(columns).eval(expr)
+
+    def __make_vector_evaluator(self, columns):
+        # numpy is imported on first use so that scalar evaluation does not depend on it
+        from expression_processor.vector_evaluator import VectorEvaluator
+        evaluator = VectorEvaluator()
+        for name, value in self.get_variables().items():
+            evaluator.define(name, float(value))
+        evaluator.define_all(columns)
+        return evaluator
 
     def eval_tokens(self, tokens):
         return self.__evaluator.eval(self.__parse_tokens_to_expression(tokens))
 
     def eval_to_string(self, expression):
         try:
-            result = self.__evaluator.eval(self.__parse_string_to_expression(expression))
-            return str(result.normalize())
+            result = self.__evaluate(self.__parse_string_to_expression(expression))
+            return self.__evaluator.backend.to_string(result)
         except Exception as e:
             return str(e)
 
     def eval_expression(self, expression):
         try:
             result = self.__evaluator.eval(expression)
-            return str(result.normalize())
+            return self.__evaluator.backend.to_string(result)
         except Exception as e:
             print("eval_expression exception: " + str(e))
             return None
 
+    def __to_number(self, name, value):
+        if isinstance(value, (Decimal, numbers.Real)):
+            return value
+        raise Exception(f"Value of '{name}' must be a number, got {type(value).__name__}")
+
     def __parse_string_to_expression(self, string):
-        return Expressionizer(Tokenizer(string).parse_tokens()).parse_expression()
+        return self.__cache.get(string, self.__parse_uncached)
+
+    def __parse_uncached(self, string):
+        expr = self.__parse_without_optimization(string)
+        if self.__optimize:
+            expr = self.__make_optimizer().optimize(expr)
+        return expr
+
+    def __parse_without_optimization(self, string):
+        return make_expressionizer(self.__tokenizer(string).parse_tokens(), self.__parser_mode,
+                                   self.__balance_chains).parse_expression()
 
     def __parse_tokens_to_expression(self, tokens):
-        return Expressionizer(tokens).parse_expression()
+        return make_expressionizer(tokens, self.__parser_mode, self.__balance_chains).parse_expression()
 
     def __parse_string_to_tokens(self, expression: str):
-        return Tokenizer(expression).parse_tokens()
+        return self.__tokenizer(expression).parse_tokens()
 
     def get_variables(self):
         return self.__evaluator.get_variables()
@@ -80,6 +221,7 @@ class EvaluatorWrapper:
             print(f"{k} = {v}")
 
 
+# Built-in functions receive Decimal arguments in Decimal mode and float arguments in float mode
 class AbsFunction(Function):
     def call(self, arguments):
         if len(arguments) != 1:
@@ -98,14 +240,20 @@ class FloorFunction(Function):
     def call(self, arguments):
         if len(arguments) != 1:
             raise Exception("floor requires one argument")
-        return arguments[0].to_integral_exact(rounding=ROUND_FLOOR)
+        value = arguments[0]
+        if isinstance(value, Decimal):
+            return value.to_integral_exact(rounding=ROUND_FLOOR)
+        return float(math.floor(value))
 
 
 class CeilFunction(Function):
     def call(self, arguments):
         if len(arguments) != 1:
             raise Exception("ceil requires one argument")
-        return arguments[0].to_integral_exact(rounding=ROUND_CEILING)
+        value = arguments[0]
+        if isinstance(value, Decimal):
+            return value.to_integral_exact(rounding=ROUND_CEILING)
+        return float(math.ceil(value))
 
 
 class RoundFunction(Function):
@@ -113,8 +261,10 @@ class RoundFunction(Function):
         if len(arguments) not in {1, 2}:
             raise Exception("round requires either one or two arguments")
         value = arguments[0]
-        scale = arguments[1] if len(arguments) == 2 else 0
-        return value.quantize(Decimal('1e-{0}'.format(scale)))
+        scale = int(arguments[1]) if len(arguments) == 2 else 0
+        if isinstance(value, Decimal):
+            return value.quantize(Decimal(1).scaleb(-scale))
+        return round(value, scale)
 
 
 class MinFunction(Function):
@@ -135,4 +285,27 @@ class SqrtFunction(Function):
     def call(self, arguments):
         if len(arguments) != 1:
             raise Exception("sqrt requires only one argument")
-        return math.sqrt(arguments[0])
+        value = arguments[0]
+        if isinstance(value, Decimal):
+            return value.sqrt()
+        return math.sqrt(value)
+
+
+class LnFunction(Function):
+    def call(self, arguments):
+        if len(arguments) != 1:
+            raise Exception("ln requires only one argument")
+        value = arguments[0]
+        if isinstance(value, Decimal):
+            return value.ln()
+        return math.log(value)
+
+
+class ExpFunction(Function):
+    def call(self, arguments):
+        if len(arguments) != 1:
+            raise Exception("exp requires only one argument")
+        value = arguments[0]
+        if isinstance(value, Decimal):
+            return value.exp()
+        return math.exp(value)
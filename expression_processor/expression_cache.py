@@ -0,0 +1,75 @@
+from collections import OrderedDict
+import threading
+
+
+# (String -> Expression) bounded LRU cache of parsed expression trees, safe to share between threads
+class ExpressionCache:
+    def __init__(self, max_size=256):
+        if max_size < 0:
+            raise Exception("Cache size must be non-negative")
+        self.__max_size = max_size
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_max_size(self):
+        return self.__max_size
+
+    def set_max_size(self, max_size):
+        if max_size < 0:
+            raise Exception("Cache size must be non-negative")
+        with self.__lock:
+            self.__max_size = max_size
+            self.__evict()
+        return self
+
+    def get(self, source, parse):
+        with self.__lock:
+            expr = self.__entries.get(source)
+            if expr is not None:
+                self.hits += 1
+                self.__entries.move_to_end(source)
+                return expr
+            self.misses += 1
+        # Parsing happens outside the lock; two threads may parse the same source, both trees are equal
+        expr = parse(source)
+        with self.__lock:
+            if self.__max_size > 0:
+                self.__entries[source] = expr
+                self.__evict()
+        return expr
+
+    # Drops one source string from the cache, or everything if source is None
+    def invalidate(self, source=None):
+        with self.__lock:
+            if source is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(source, None)
+        return self
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        return self
+
+    def stats(self):
+        return {"size": len(self.__entries),
+                "max_size": self.__max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions}
+
+    def __evict(self):
+        while len(self.__entries) > self.__max_size:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, source):
+        return source in self.__entries
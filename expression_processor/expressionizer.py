@@ -196,8 +196,16 @@ class ExpressionSolver:
     def visit_grouping_expr(self, expr) -> float:
         pass
 
+    def visit_shared_expr(self, expr) -> float:
+        pass
+
+    def visit_optimized_expr(self, expr) -> float:
+        pass
+
 
 class Expression:
+    __slots__ = ()
+
     def accept(self, visitor: ExpressionSolver) -> float:
         pass
 
@@ -206,6 +214,8 @@ class Expression:
 
 
 class AssignExpression(Expression):
+    __slots__ = ("name", "value")
+
     def __init__(self, name: TokenType, value: Expression):
         self.name = name
         self.value = value
@@ -220,6 +230,8 @@ class AssignExpression(Expression):
 
 
 class LogicalExpression(Expression):
+    __slots__ = ("left", "operator", "right")
+
     def __init__(self, left: Expression, operator: TokenType, right: Expression):
         self.left = left
         self.operator = operator
@@ -236,6 +248,8 @@ class LogicalExpression(Expression):
 
 
 class BinaryExpression(Expression):
+    __slots__ = ("left", "operator", "right")
+
     def __init__(self, left: Expression, operator: TokenType, right: Expression):
         self.left = left
         self.operator = operator
@@ -252,6 +266,8 @@ class BinaryExpression(Expression):
 
 
 class UnaryExpression(Expression):
+    __slots__ = ("operator", "right")
+
     def __init__(self, operator: TokenType, right: Expression):
         self.operator = operator
         self.right = right
@@ -266,6 +282,8 @@ class UnaryExpression(Expression):
 
 
 class CallExpression(Expression):
+    __slots__ = ("name", "arguments")
+
     def __init__(self, name: str, arguments):
         self.name = name
         self.arguments = arguments
@@ -287,6 +305,8 @@ class CallExpression(Expression):
 
 
 class LiteralExpression(Expression):
+    __slots__ = ("value",)
+
     def __init__(self, value: float):
         self.value = value
 
@@ -299,6 +319,8 @@ class LiteralExpression(Expression):
 
 
 class VariableExpression(Expression):
+    __slots__ = ("name",)
+
     def __init__(self, name: Token):
         self.name = name
 
@@ -311,6 +333,8 @@ class VariableExpression(Expression):
 
 
 class GroupingExpression(Expression):
+    __slots__ = ("expression",)
+
     def __init__(self, expression: Expression):
         self.expression = expression
 
@@ -320,3 +344,82 @@ class GroupingExpression(Expression):
     def __str__(self):
         return (self.__class__.__name__ + ":\t(" +
                 self.expression.__class__.__name__ + ")")
+
+
+# Subtree that occurs several times in an optimized expression; it is computed once per evaluation
+# and its value is kept in slot number index
+class SharedExpression(Expression):
+    __slots__ = ("expression", "index")
+
+    def __init__(self, expression: Expression, index: int):
+        self.expression = expression
+        self.index = index
+
+    def accept(self, visitor: ExpressionSolver):
+        return visitor.visit_shared_expr(self)
+
+    def __str__(self):
+        return (self.__class__.__name__ + ":\t(" +
+                self.expression.__class__.__name__ + ", " +
+                str(self.index) + ")")
+
+
+# Root of an expression produced by ExpressionOptimizer, holds the number of shared slots
+class OptimizedExpression(Expression):
+    __slots__ = ("expression", "shared_count", "assigned_names", "removed_nodes")
+
+    def __init__(self, expression: Expression, shared_count: int, assigned_names, removed_nodes: int):
+        self.expression = expression
+        self.shared_count = shared_count
+        self.assigned_names = assigned_names
+        self.removed_nodes = removed_nodes
+
+    def accept(self, visitor: ExpressionSolver):
+        return visitor.visit_optimized_expr(self)
+
+    def __str__(self):
+        return (self.__class__.__name__ + ":\t(" +
+                self.expression.__class__.__name__ + ", " +
+                str(self.shared_count) + ")")
+
+
+def children(node):
+    if isinstance(node, (BinaryExpression, LogicalExpression)):
+        return [node.left, node.right]
+    if isinstance(node, UnaryExpression):
+        return [node.right]
+    if isinstance(node, AssignExpression):
+        return [node.value]
+    if isinstance(node, CallExpression):
+        return list(node.arguments)
+    if isinstance(node, (LiteralExpression, VariableExpression)):
+        return []
+    # GroupingExpression, SharedExpression and OptimizedExpression
+    return [node.expression]
+
+
+def replace_children(node, replace):
+    if isinstance(node, (BinaryExpression, LogicalExpression)):
+        node.left = replace(node.left)
+        node.right = replace(node.right)
+    elif isinstance(node, UnaryExpression):
+        node.right = replace(node.right)
+    elif isinstance(node, AssignExpression):
+        node.value = replace(node.value)
+    elif isinstance(node, CallExpression):
+        node.arguments = [replace(arg) for arg in node.arguments]
+    elif not isinstance(node, (LiteralExpression, VariableExpression)):
+        node.expression = replace(node.expression)
+
+
+# Iterates over every distinct node of an expression tree (or DAG) once
+def walk(expr):
+    stack = [expr]
+    seen = {id(expr)}
+    while stack:
+        node = stack.pop()
+        yield node
+        for child in children(node):
+            if id(child) not in seen:
+                seen.add(id(child))
+                stack.append(child)
@@ -0,0 +1,253 @@
+import re
+
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+from expression_processor.expressionizer import AssignExpression, BinaryExpression, VariableExpression, walk
+from expression_processor.parsing_tasks import check_for_expr, constraint_tokentypes_list
+
+# Message of the evaluators for a variable without a value, shown in Russian like the other sheet errors
+_UNDEFINED_VARIABLE = re.compile(r"Undefined variable '(.*)'")
+
+
+# One formula of a FormulaSheet. reads and writes are the lower-case names of the variables the formula
+# uses and assigns; assigned holds the values it assigned in the last evaluation. inputs are the formulas
+# that assign the variables it reads.
+class FormulaCell:
+    def __init__(self, text):
+        self.text = text
+        self.compiled = None
+        self.reads = frozenset()
+        self.writes = frozenset()
+        self.constraint = False
+        self.parse_error = None
+        self.inputs = frozenset()
+        self.graph_error = None
+        self.value = None
+        self.error = None
+        self.assigned = {}
+
+    def is_empty(self):
+        return self.text.strip() == ""
+
+
+# Numbered formulas F0, F1, ... forming a dependency graph: a formula that reads a variable depends on the
+# formula that assigns it, wherever that formula is in the sheet. Formulas are evaluated in topological
+# order; every variable may be assigned by one formula only, and formulas on a dependency cycle get an
+# error instead of a value.
+# Parse trees are kept per formula until its text changes, and update() re-evaluates only the formulas that
+# were edited and those downstream of them. A re-evaluated formula that assigns the same values as before
+# stops the change from spreading further.
+class FormulaSheet:
+    def __init__(self, ew=None):
+        self.__ew = ew if ew is not None else EvaluatorWrapper()
+        self.__cells = []
+        self.__dirty = set()
+        self.__graph_changed = False
+        # Formulas grouped by depth in the graph; formulas of one level do not depend on each other
+        self.__levels = []
+        self.__writers = {}
+
+    def __len__(self):
+        return len(self.__cells)
+
+    def cell(self, index):
+        return self.__cells[index]
+
+    def formulas(self):
+        return [cell.text for cell in self.__cells]
+
+    # Lists of formula indices that can be evaluated together, in evaluation order
+    def levels(self):
+        self.__update_graph()
+        positions = {cell: i for i, cell in enumerate(self.__cells)}
+        return [sorted(positions[cell] for cell in level) for level in self.__levels]
+
+    # index == len(self) appends a formula
+    def set_formula(self, index, text):
+        if index == len(self.__cells):
+            self.insert_formula(index, text)
+        elif self.__cells[index].text != text:
+            # The cell object stays the same, so the formulas that depend on it keep their inputs
+            cell = self.__cells[index]
+            self.__parse(cell, text)
+            self.__dirty.add(cell)
+            self.__graph_changed = True
+
+    # Sets all formulas at once; only the ones whose text differs are parsed again
+    def set_formulas(self, texts):
+        while len(self.__cells) > len(texts):
+            self.remove_formula(len(self.__cells) - 1)
+        for i in range(len(texts)):
+            self.set_formula(i, texts[i])
+
+    def insert_formula(self, index, text):
+        cell = FormulaCell(text)
+        self.__parse(cell, text)
+        self.__cells.insert(index, cell)
+        self.__dirty.add(cell)
+        self.__graph_changed = True
+
+    def remove_formula(self, index):
+        self.__dirty.discard(self.__cells.pop(index))
+        self.__graph_changed = True
+
+    # Re-evaluates the formulas affected by the changes since the last update and returns their indices.
+    # With an executor (concurrent.futures) the formulas of one level are evaluated in parallel.
+    def update(self, executor=None):
+        self.__update_graph()
+        base = self.__ew.get_variables()
+        changed = set()
+        evaluated = set()
+        for level in self.__levels:
+            batch = [cell for cell in level if cell in self.__dirty or not cell.inputs.isdisjoint(changed)]
+            old = [cell.assigned for cell in batch]
+            if executor is not None and len(batch) > 1:
+                list(executor.map(lambda cell: self.__evaluate(cell, base), batch))
+            else:
+                for cell in batch:
+                    self.__evaluate(cell, base)
+            for cell, assigned in zip(batch, old):
+                if cell.assigned != assigned:
+                    changed.add(cell)
+            evaluated.update(batch)
+        self.__dirty.clear()
+        return [i for i in range(len(self.__cells)) if self.__cells[i] in evaluated]
+
+    # Re-evaluates everything, e.g. after variables of the underlying EvaluatorWrapper were redefined
+    def update_all(self, executor=None):
+        self.__dirty = set(self.__cells)
+        return self.update(executor)
+
+    def __parse(self, cell, text):
+        cell.text = text
+        cell.compiled = None
+        cell.reads = frozenset()
+        cell.writes = frozenset()
+        cell.constraint = False
+        cell.parse_error = None
+        if cell.is_empty():
+            return
+        try:
+            expr = self.__ew.parse(text)
+            cell.compiled = self.__ew.compile(expr)
+        except Exception as e:
+            cell.parse_error = str(e)
+            return
+        nodes = list(walk(expr))
+        cell.reads = frozenset(node.name.lexeme.lower() for node in nodes if isinstance(node, VariableExpression))
+        cell.writes = frozenset(node.name.lexeme.lower() for node in nodes if isinstance(node, AssignExpression))
+        cell.constraint = check_for_expr(expr, BinaryExpression, constraint_tokentypes_list)
+
+    # Rebuilds inputs and levels after formulas were edited; formulas whose inputs changed are re-evaluated
+    def __update_graph(self):
+        if not self.__graph_changed:
+            return
+        self.__graph_changed = False
+        cells = self.__cells
+        writers = {}
+        for cell in cells:
+            for name in cell.writes:
+                writers.setdefault(name, []).append(cell)
+        graph_errors = {}
+        for name, cells_of_name in writers.items():
+            if len(cells_of_name) > 1:
+                for cell in cells_of_name:
+                    graph_errors[cell] = f"Переменная '{name}' присваивается в нескольких формулах"
+        self.__writers = {name: cells_of_name[0] for name, cells_of_name in writers.items()
+                          if len(cells_of_name) == 1}
+        for cell in cells:
+            inputs = frozenset(self.__writers[name] for name in cell.reads if name in self.__writers)
+            if inputs != cell.inputs:
+                cell.inputs = inputs
+                self.__dirty.add(cell)
+
+        levels, rest = _levels(cells, set())
+        if rest:
+            # Formulas that only depend on a cycle are not on it: peel them off from the end
+            dependents = {cell: 0 for cell in rest}
+            for cell in rest:
+                for source in cell.inputs:
+                    if source in dependents:
+                        dependents[source] += 1
+            peel = [cell for cell in rest if dependents[cell] == 0]
+            while peel:
+                cell = peel.pop()
+                del dependents[cell]
+                for source in cell.inputs:
+                    if source in dependents:
+                        dependents[source] -= 1
+                        if dependents[source] == 0:
+                            peel.append(source)
+            cyclic = set(dependents)
+            for cell in cyclic:
+                names = sorted(name for name in cell.reads if self.__writers.get(name) in cyclic)
+                graph_errors.setdefault(cell, f"Циклическая зависимость через {', '.join(names)}")
+            # The cyclic formulas come first and assign nothing, so everything below them can be ordered
+            levels, _ = _levels(cells, cyclic)
+            levels.insert(0, [cell for cell in cells if cell in cyclic])
+        for cell in cells:
+            graph_error = graph_errors.get(cell)
+            if graph_error != cell.graph_error:
+                cell.graph_error = graph_error
+                self.__dirty.add(cell)
+        self.__levels = levels
+
+    def __evaluate(self, cell, base):
+        cell.value = None
+        cell.assigned = {}
+        cell.error = cell.parse_error or cell.graph_error
+        if cell.compiled is None or cell.error is not None:
+            return
+        environment = {}
+        for name in cell.reads:
+            writer = self.__writers.get(name)
+            value = writer.assigned.get(name) if writer is not None else base.get(name)
+            if value is not None:
+                environment[name] = value
+        try:
+            cell.value = self.__ew.eval_compiled(cell.compiled, environment)
+        except Exception as e:
+            undefined = _UNDEFINED_VARIABLE.fullmatch(str(e))
+            cell.error = f"Переменная '{undefined.group(1)}' не определена" if undefined else str(e)
+            return
+        cell.assigned = {name: environment[name] for name in cell.writes if name in environment}
+
+
+# Formula sheet file: one formula per line, UTF-8
+def read_formulas(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        formulas = [line.rstrip("\r\n") for line in f]
+    while formulas and formulas[-1].strip() == "":
+        formulas.pop()
+    return formulas
+
+
+def write_formulas(filename, formulas):
+    with open(filename, 'w', encoding='utf-8') as f:
+        for formula in formulas:
+            f.write(formula + "\n")
+
+
+# Kahn's algorithm by levels over the given cells, not following edges from the cells in skip.
+# Returns the levels and the cells that could not be ordered (those on or below a cycle).
+def _levels(cells, skip):
+    members = set(cells)
+    pending = {}
+    dependents = {cell: [] for cell in cells}
+    for cell in cells:
+        sources = [source for source in cell.inputs if source in members and source not in skip]
+        pending[cell] = len(sources)
+        for source in sources:
+            dependents[source].append(cell)
+    level = [cell for cell in cells if pending[cell] == 0 and cell not in skip]
+    levels = []
+    while level:
+        levels.append(level)
+        next_level = []
+        for cell in level:
+            for dependent in dependents[cell]:
+                pending[dependent] -= 1
+                if pending[dependent] == 0 and dependent not in skip:
+                    next_level.append(dependent)
+        level = next_level
+    ordered = {cell for level in levels for cell in level}
+    return levels, [cell for cell in cells if cell not in ordered and cell not in skip]
@@ -0,0 +1,88 @@
+from decimal import Decimal, localcontext
+from enum import Enum, auto
+import math
+import numbers
+import operator
+
+
+class NumericMode(Enum):
+    # Arbitrary precision, every operation is rounded to math_context.prec digits
+    DECIMAL = auto()
+    # Native float64, no conversions
+    FLOAT = auto()
+
+
+# Every backend exposes the same set of operations, so evaluators can bind them once
+# and call them without checking the mode
+class DecimalBackend:
+    mode = NumericMode.DECIMAL
+
+    def __init__(self, context):
+        self.context = context
+        self.zero = Decimal(0)
+        self.one = Decimal(1)
+        self.add = context.add
+        self.subtract = context.subtract
+        self.multiply = context.multiply
+        self.divide = context.divide
+        self.remainder = context.remainder
+        self.power = context.power
+        self.negate = context.minus
+        self.sqrt = context.sqrt
+
+    def number(self, value):
+        if isinstance(value, Decimal):
+            return value
+        if isinstance(value, numbers.Integral):
+            return self.context.create_decimal(int(value))
+        return self.context.create_decimal_from_float(float(value))
+
+    def boolean(self, value):
+        return self.one if value else self.zero
+
+    # Functions use Decimal methods that read the current context, so they run in a thread-local copy of ours
+    def call(self, function, arguments):
+        with localcontext(self.context):
+            return self.number(function.call(arguments))
+
+    def to_string(self, value):
+        return str(value.normalize(self.context))
+
+
+class FloatBackend:
+    mode = NumericMode.FLOAT
+
+    def __init__(self):
+        self.zero = 0.0
+        self.one = 1.0
+        self.add = operator.add
+        self.subtract = operator.sub
+        self.multiply = operator.mul
+        self.divide = operator.truediv
+        # Same sign rule as Decimal remainder: the result takes the sign of the dividend
+        self.remainder = math.fmod
+        self.power = math.pow
+        self.negate = operator.neg
+        self.sqrt = math.sqrt
+
+    def number(self, value):
+        return float(value)
+
+    def boolean(self, value):
+        return self.one if value else self.zero
+
+    def call(self, function, arguments):
+        return float(function.call(arguments))
+
+    def to_string(self, value):
+        return repr(value)
+
+
+def make_backend(mode, context):
+    match mode:
+        case NumericMode.DECIMAL:
+            return DecimalBackend(context)
+        case NumericMode.FLOAT:
+            return FloatBackend()
+        case _:
+            raise Exception(f"Unknown numeric mode '{mode}'")
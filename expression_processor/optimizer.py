@@ -0,0 +1,193 @@
+import math
+
+from expression_processor.evaluator import Evaluator
+from expression_processor.expressionizer import ExpressionSolver, AssignExpression, LogicalExpression, \
+    BinaryExpression, UnaryExpression, CallExpression, LiteralExpression, VariableExpression, SharedExpression, \
+    OptimizedExpression, children, replace_children, walk
+from expression_processor.tokenizer import TokenType
+
+
+# (Expression -> OptimizedExpression) processor
+# Folds constant subtrees (literals, the given constants and pure functions of constants), removes
+# groupings and algebraic identities (x + -0, x - 0, x * 1, x / 1, x ^ 1, --x) and merges identical subtrees,
+# so that every shared subtree is computed once per evaluation. x + 0 is kept: for x = -0 it gives +0.
+class ExpressionOptimizer(ExpressionSolver):
+    def __init__(self, evaluator, constants=None, pure_functions=None):
+        self.__constants = {name.lower(): value for name, value in (constants or {}).items()}
+        self.__pure_functions = {name.lower(): function for name, function in (pure_functions or {}).items()}
+        self.__folder = Evaluator(evaluator.get_numeric_mode(), evaluator.math_context)
+        for name, function in self.__pure_functions.items():
+            self.__folder.add_function(name, function)
+        self.__zero = evaluator.backend.zero
+        self.__one = evaluator.backend.one
+        self.removed_nodes = 0
+        self.__reset({})
+
+    def __reset(self, assigned):
+        self.__assigned = assigned
+        self.__nodes = {}
+        # Maps id -> node, which also keeps the nodes alive so that their ids stay unique
+        self.__unshareable = {}
+
+    def optimize(self, expr):
+        if isinstance(expr, OptimizedExpression):
+            expr = expr.expression
+        assigned = assigned_names(expr)
+        self.__reset(assigned)
+        self.__folder.define_values({name: value for name, value in self.__constants.items()
+                                     if name not in assigned})
+        root = expr.accept(self)
+        shared_count = self.__share(root)
+        self.removed_nodes = count_nodes(expr) - count_nodes(root)
+        result = OptimizedExpression(root, shared_count, frozenset(assigned), self.removed_nodes)
+        self.__reset({})
+        return result
+
+    # Wraps every repeated side-effect-free subtree in a SharedExpression
+    def __share(self, root):
+        references = {}
+        unique = list(walk(root))
+        for node in unique:
+            for child in children(node):
+                references[id(child)] = references.get(id(child), 0) + 1
+        wrappers = {}
+        for node in unique:
+            if references.get(id(node), 0) > 1 and id(node) not in self.__unshareable and \
+                    not isinstance(node, (LiteralExpression, VariableExpression)):
+                wrappers[id(node)] = SharedExpression(node, len(wrappers))
+        for node in unique:
+            replace_children(node, lambda child: wrappers.get(id(child), child))
+        return len(wrappers)
+
+    def __intern(self, key, node, *parts):
+        if any(id(part) in self.__unshareable for part in parts):
+            self.__unshareable[id(node)] = node
+            return node
+        existing = self.__nodes.get(key)
+        if existing is not None:
+            return existing
+        self.__nodes[key] = node
+        return node
+
+    # 0 and -0 are equal and hash alike, so the sign is part of the key
+    def __literal(self, value):
+        return self.__intern(("literal", value, _sign_of_zero(value)), LiteralExpression(value))
+
+    def __fold(self, node):
+        try:
+            return self.__literal(self.__folder.eval(node))
+        except Exception:
+            # Errors such as division by zero are left to be raised at evaluation time
+            return node
+
+    def __is_literal(self, node, value=None):
+        return isinstance(node, LiteralExpression) and (value is None or node.value == value)
+
+    def __is_zero(self, node, sign):
+        return self.__is_literal(node, 0) and _sign_of_zero(node.value) == sign
+
+    def visit_assign_expr(self, expr):
+        node = AssignExpression(expr.name, expr.value.accept(self))
+        self.__unshareable[id(node)] = node
+        return node
+
+    def visit_logical_expr(self, expr):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        node = LogicalExpression(left, expr.operator, right)
+        if self.__is_literal(left):
+            truthy = left.value != self.__zero
+            if expr.operator.type == TokenType.LOGICAL_OR and truthy:
+                return self.__literal(self.__one)
+            if expr.operator.type == TokenType.LOGICAL_AND and not truthy:
+                return self.__literal(self.__zero)
+            if self.__is_literal(right):
+                return self.__fold(node)
+        return self.__intern(("logical", expr.operator.type, id(left), id(right)), node, left, right)
+
+    def visit_binary_expr(self, expr):
+        left = expr.left.accept(self)
+        right = expr.right.accept(self)
+        operator = expr.operator.type
+        if self.__is_literal(left) and self.__is_literal(right):
+            return self.__fold(BinaryExpression(left, expr.operator, right))
+        match operator:
+            case TokenType.PLUS:
+                if self.__is_zero(right, -1):
+                    return left
+                if self.__is_zero(left, -1):
+                    return right
+            case TokenType.MINUS:
+                if self.__is_zero(right, 1):
+                    return left
+            case TokenType.STAR:
+                if self.__is_literal(right, 1):
+                    return left
+                if self.__is_literal(left, 1):
+                    return right
+            case TokenType.SLASH | TokenType.EXPONENT:
+                if self.__is_literal(right, 1):
+                    return left
+        node = BinaryExpression(left, expr.operator, right)
+        return self.__intern(("binary", operator, id(left), id(right)), node, left, right)
+
+    def visit_unary_expr(self, expr):
+        right = expr.right.accept(self)
+        node = UnaryExpression(expr.operator, right)
+        if self.__is_literal(right):
+            return self.__fold(node)
+        if expr.operator.type == TokenType.MINUS and isinstance(right, UnaryExpression) and \
+                right.operator.type == TokenType.MINUS:
+            return right.right
+        return self.__intern(("unary", expr.operator.type, id(right)), node, right)
+
+    def visit_call_expr(self, expr):
+        arguments = [arg.accept(self) for arg in expr.arguments]
+        node = CallExpression(expr.name, arguments)
+        name = expr.name.lower()
+        if name not in self.__pure_functions:
+            self.__unshareable[id(node)] = node
+            return node
+        if all(self.__is_literal(arg) for arg in arguments):
+            return self.__fold(node)
+        return self.__intern(("call", name, tuple(id(arg) for arg in arguments)), node, *arguments)
+
+    def visit_literal_expr(self, expr):
+        return self.__literal(expr.value)
+
+    def visit_variable_expr(self, expr):
+        name = expr.name.lexeme.lower()
+        if name in self.__assigned:
+            node = VariableExpression(expr.name)
+            self.__unshareable[id(node)] = node
+            return node
+        if name in self.__constants:
+            return self.__literal(self.__constants[name])
+        return self.__intern(("variable", name), VariableExpression(expr.name))
+
+    def visit_grouping_expr(self, expr):
+        return expr.expression.accept(self)
+
+    def visit_shared_expr(self, expr):
+        return expr.expression.accept(self)
+
+    def visit_optimized_expr(self, expr):
+        return expr.expression.accept(self)
+
+
+# -1 for negative zeros, 1 for everything else
+def _sign_of_zero(value):
+    try:
+        return -1 if value == 0 and math.copysign(1, value) < 0 else 1
+    except TypeError:
+        return 1
+
+
+# Lower-case names of all variables assigned anywhere in an expression
+def assigned_names(expr):
+    return {node.name.lexeme.lower() for node in walk(expr) if isinstance(node, AssignExpression)}
+
+
+# Number of distinct computing nodes; SharedExpression and OptimizedExpression wrappers are not counted
+def count_nodes(expr):
+    return sum(1 for node in walk(expr) if not isinstance(node, (SharedExpression, OptimizedExpression)))
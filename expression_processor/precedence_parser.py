@@ -0,0 +1,222 @@
+from enum import Enum, auto
+
+from expression_processor.expressionizer import Expressionizer, AssignExpression, LogicalExpression, \
+    BinaryExpression, UnaryExpression, CallExpression, LiteralExpression, VariableExpression, GroupingExpression, \
+    children, replace_children
+from expression_processor.tokenizer import TokenType
+
+
+class ParserMode(Enum):
+    # Expressionizer, recursive descent
+    RECURSIVE = auto()
+    # PrecedenceExpressionizer, no recursion limit and linear time
+    PRECEDENCE = auto()
+
+
+# balance_chains (see the function of that name) is supported by ParserMode.PRECEDENCE only
+def make_expressionizer(tokens, mode=ParserMode.RECURSIVE, balance_chains=False):
+    match mode:
+        case ParserMode.RECURSIVE:
+            if balance_chains:
+                raise Exception("Chain balancing needs ParserMode.PRECEDENCE")
+            return Expressionizer(tokens)
+        case ParserMode.PRECEDENCE:
+            return PrecedenceExpressionizer(tokens, balance_chains)
+        case _:
+            raise Exception(f"Unknown parser mode '{mode}'")
+
+
+# Binding power and right associativity of infix operators, same grammar as Expressionizer
+_INFIX = {
+    TokenType.ASSIGN: (1, True),
+    TokenType.LOGICAL_OR: (2, False),
+    TokenType.LOGICAL_AND: (3, False),
+    TokenType.EQUAL: (4, False),
+    TokenType.NOT_EQUAL: (4, False),
+    TokenType.GREATER: (5, False),
+    TokenType.GREATER_EQUAL: (5, False),
+    TokenType.LESS: (5, False),
+    TokenType.LESS_EQUAL: (5, False),
+    TokenType.PLUS: (6, False),
+    TokenType.MINUS: (6, False),
+    TokenType.STAR: (7, False),
+    TokenType.SLASH: (7, False),
+    TokenType.MODULO: (7, False),
+    TokenType.EXPONENT: (9, True),
+}
+# Prefix '-' and '√' bind tighter than '*' but looser than '^': -a^b is -(a^b)
+_PREFIX_POWER = 8
+
+
+# (Token[] -> Expression) processor
+# Operator-precedence (shunting-yard) parser. Produces the same trees as Expressionizer, but keeps its
+# state in explicit stacks, so the nesting depth and length of an expression are not limited by recursion.
+class PrecedenceExpressionizer:
+    def __init__(self, tokens, balance_chains=False):
+        self.__tokens = tokens
+        self.__balance_chains = balance_chains
+
+    def parse_expression(self):
+        tokens = self.__tokens
+        # One context per open parenthesis or call, the bottom one is the whole expression
+        contexts = [_Context(None)]
+        context = contexts[0]
+        expect_operand = True
+        current = 0
+        while tokens[current].type != TokenType.EOF:
+            token = tokens[current]
+            token_type = token.type
+            current += 1
+            if expect_operand:
+                if token_type == TokenType.NUMBER:
+                    context.operands.append(LiteralExpression(token.literal))
+                    expect_operand = False
+                elif token_type == TokenType.IDENTIFIER:
+                    if tokens[current].type == TokenType.LEFT_PAREN:
+                        current += 1
+                        context = _Context(TokenType.IDENTIFIER, token)
+                        contexts.append(context)
+                        if tokens[current].type == TokenType.RIGHT_PAREN:
+                            current += 1
+                            contexts.pop()
+                            context = contexts[-1]
+                            context.operands.append(CallExpression(token.lexeme, []))
+                            expect_operand = False
+                    else:
+                        context.operands.append(VariableExpression(token))
+                        expect_operand = False
+                elif token_type == TokenType.LEFT_PAREN:
+                    context = _Context(TokenType.LEFT_PAREN)
+                    contexts.append(context)
+                elif token_type == TokenType.MINUS or token_type == TokenType.SQUARE_ROOT:
+                    context.operators.append((token, _PREFIX_POWER, True))
+                else:
+                    raise Exception("Expected expression after " + tokens[current - 2].lexeme)
+            else:
+                infix = _INFIX.get(token_type)
+                if infix is not None:
+                    power, right_associative = infix
+                    self.__reduce(context, power, right_associative)
+                    if token_type == TokenType.ASSIGN and not isinstance(context.operands[-1], VariableExpression):
+                        # Reported once the assigned value ends, as Expressionizer does
+                        context.invalid_assignment = True
+                    context.operators.append((token, power, False))
+                    expect_operand = True
+                elif token_type == TokenType.RIGHT_PAREN and context.kind is not None:
+                    expr = self.__reduce_all(context)
+                    contexts.pop()
+                    parent = contexts[-1]
+                    if context.kind == TokenType.LEFT_PAREN:
+                        parent.operands.append(GroupingExpression(expr))
+                    else:
+                        context.arguments.append(expr)
+                        parent.operands.append(CallExpression(context.name.lexeme, context.arguments))
+                    context = parent
+                elif token_type == TokenType.COMMA and context.kind == TokenType.IDENTIFIER:
+                    context.arguments.append(self.__reduce_all(context))
+                    expect_operand = True
+                elif context.invalid_assignment:
+                    raise Exception("(__assignment) Invalid assignment target")
+                elif context.kind is None:
+                    raise Exception("Expected end of expression, found '" + str(token.lexeme + "'"))
+                else:
+                    raise Exception(self.__missing_paren(context, tokens[current - 2]))
+        if expect_operand:
+            raise Exception("Expected expression after " + tokens[current - 1].lexeme)
+        if len(contexts) > 1:
+            if context.invalid_assignment:
+                raise Exception("(__assignment) Invalid assignment target")
+            raise Exception(self.__missing_paren(context, tokens[current - 1]))
+        expr = self.__reduce_all(context)
+        if self.__balance_chains:
+            expr = balance_chains(expr)
+        return expr
+
+    def __missing_paren(self, context, previous):
+        where = "(__call)" if context.kind == TokenType.IDENTIFIER else "(__primary)"
+        return "Consume exception with message: " + where + " Expected ')' after " + previous.lexeme
+
+    # Applies operators from the top of the stack that bind at least as tight as the incoming one
+    def __reduce(self, context, power, right_associative):
+        operators = context.operators
+        while operators:
+            top_power = operators[-1][1]
+            if top_power < power or (right_associative and top_power == power):
+                break
+            self.__apply(context)
+
+    def __reduce_all(self, context):
+        while context.operators:
+            self.__apply(context)
+        expr = context.operands.pop()
+        context.operands.clear()
+        return expr
+
+    def __apply(self, context):
+        operator, _, prefix = context.operators.pop()
+        operands = context.operands
+        right = operands.pop()
+        if prefix:
+            operands.append(UnaryExpression(operator, right))
+            return
+        left = operands.pop()
+        match operator.type:
+            case TokenType.ASSIGN:
+                if not isinstance(left, VariableExpression):
+                    raise Exception("(__assignment) Invalid assignment target")
+                operands.append(AssignExpression(left.name, right))
+            case TokenType.LOGICAL_OR | TokenType.LOGICAL_AND:
+                operands.append(LogicalExpression(left, operator, right))
+            case _:
+                operands.append(BinaryExpression(left, operator, right))
+
+
+class _Context:
+    __slots__ = ("operands", "operators", "kind", "name", "arguments", "invalid_assignment")
+
+    def __init__(self, kind, name=None):
+        self.operands = []
+        self.operators = []
+        self.kind = kind
+        self.name = name
+        self.arguments = []
+        self.invalid_assignment = False
+
+
+# Rebuilds long left-leaning chains of one operator (a + b + c + ...) or (a * b * c * ...) as balanced
+# trees, so that recursive evaluators only need O(log n) stack depth. Rounding happens in a different
+# order, so in Decimal mode the last digit of such sums may differ from the left-to-right result.
+def balance_chains(expr):
+    root = GroupingExpression(expr)
+    balanced = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        replace_children(node, lambda child: _balance_chain(child, balanced))
+        stack.extend(children(node))
+    return root.expression
+
+
+def _balance_chain(node, balanced):
+    if not isinstance(node, BinaryExpression) or node.operator.type not in (TokenType.PLUS, TokenType.STAR):
+        return node
+    chain = node
+    operator = node.operator
+    operands = []
+    while isinstance(node, BinaryExpression) and node.operator.type == operator.type and id(node) not in balanced:
+        operands.append(node.right)
+        node = node.left
+    operands.append(node)
+    if len(operands) <= 2:
+        return chain
+    operands.reverse()
+    while len(operands) > 1:
+        paired = []
+        for i in range(0, len(operands) - 1, 2):
+            pair = BinaryExpression(operands[i], operator, operands[i + 1])
+            balanced.add(id(pair))
+            paired.append(pair)
+        if len(operands) % 2:
+            paired.append(operands[-1])
+        operands = paired
+    return operands[0]
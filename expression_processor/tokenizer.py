@@ -1,4 +1,6 @@
 from enum import Enum, auto
+import re
+import sys
 
 
 # (String -> Token[]) processor
@@ -116,7 +118,9 @@ class Tokenizer:
     def __identifier(self):
         while (self.__is_alpha_numeric_char(self.__peek())):
             self.__advance()
-        self.__add_token(TokenType.IDENTIFIER)
+        # Interned, so every occurrence of a name shares one string
+        text = sys.intern(self.__source[self.__start:self.__current])
+        self.__tokens.append(Token(TokenType.IDENTIFIER, text, None))
 
     def __advance(self):
         index = self.__current
@@ -166,6 +170,8 @@ class Tokenizer:
 
 
 class Token:
+    __slots__ = ("type", "lexeme", "literal")
+
     def __init__(self, type, lexeme, literal):
         self.type = type
         self.lexeme = lexeme
@@ -206,6 +212,74 @@ class TokenType(Enum):
     EOF = auto()
 
 
+# (String -> Token[]) processor
+# Same token stream as Tokenizer, but the source is scanned by one compiled regular expression instead of
+# character by character. Sources with non-ASCII characters other than '√' (e.g. Cyrillic identifiers)
+# are handed over to Tokenizer, because the str.isalpha()/str.isdigit() rules can not be expressed exactly
+# as regex character classes.
+class FastTokenizer:
+    # A number continues with digits or '.', with 'e'/'E' after a digit and before a digit or sign,
+    # and with a sign right after 'e'/'E' and before a digit, exactly as Tokenizer.__is_digit decides
+    __pattern = re.compile(r"""
+        [ \r\t]*
+        (?:(?P<number>[0-9.](?:[0-9.]|(?<=[0-9.])[eE](?=[0-9.+\-])|(?<=[eE])[+\-](?=[0-9.]))*)
+          |(?P<identifier>[A-Za-z_][A-Za-z0-9_.]*)
+          |(?P<operator>==|!=|>=|<=|\|\||&&|[-+*/%^√=><,()])
+          |(?P<invalid>.)
+          |$)
+        """, re.VERBOSE | re.DOTALL)
+    # Operator tokens carry no state besides their type and text, so one instance of each is shared
+    __operators = {
+        "+": Token(TokenType.PLUS, "+", None),
+        "-": Token(TokenType.MINUS, "-", None),
+        "*": Token(TokenType.STAR, "*", None),
+        "/": Token(TokenType.SLASH, "/", None),
+        "%": Token(TokenType.MODULO, "%", None),
+        "^": Token(TokenType.EXPONENT, "^", None),
+        "√": Token(TokenType.SQUARE_ROOT, "√", None),
+        "=": Token(TokenType.ASSIGN, "=", None),
+        "==": Token(TokenType.EQUAL, "==", None),
+        "!=": Token(TokenType.NOT_EQUAL, "!=", None),
+        ">": Token(TokenType.GREATER, ">", None),
+        ">=": Token(TokenType.GREATER_EQUAL, ">=", None),
+        "<": Token(TokenType.LESS, "<", None),
+        "<=": Token(TokenType.LESS_EQUAL, "<=", None),
+        "||": Token(TokenType.LOGICAL_OR, "||", None),
+        "&&": Token(TokenType.LOGICAL_AND, "&&", None),
+        ",": Token(TokenType.COMMA, ",", None),
+        "(": Token(TokenType.LEFT_PAREN, "(", None),
+        ")": Token(TokenType.RIGHT_PAREN, ")", None),
+    }
+
+    def __init__(self, source):
+        self.__source = source
+
+    def parse_tokens(self):
+        source = self.__source
+        if not source.replace("√", "").isascii():
+            return Tokenizer(source).parse_tokens()
+        tokens = []
+        append = tokens.append
+        operators = self.__operators
+        intern = sys.intern
+        number_type = TokenType.NUMBER
+        identifier_type = TokenType.IDENTIFIER
+        # Every match is one token with the whitespace in front of it, trailing whitespace matches nothing
+        for match in self.__pattern.finditer(source):
+            kind = match.lastgroup
+            if kind == "operator":
+                append(operators[match.group(kind)])
+            elif kind == "identifier":
+                append(Token(identifier_type, intern(match.group(kind)), None))
+            elif kind == "number":
+                text = match.group(kind)
+                append(Token(number_type, text, float(text)))
+            elif kind == "invalid":
+                raise Exception("Invalid token " + match.group(kind))
+        append(Token(TokenType.EOF, "", None))
+        return tokens
+
+
 def token_list_to_string(tokens):
     str1 = ""
     for t in tokens:
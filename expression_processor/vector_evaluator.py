@@ -0,0 +1,179 @@
+from functools import reduce
+
+import numpy as np
+
+from expression_processor.evaluator import Function
+from expression_processor.expressionizer import ExpressionSolver
+from expression_processor.tokenizer import TokenType
+
+
+# (Expression -> numpy.ndarray) processor
+# Evaluates one expression over whole columns of bindings at once. Arithmetic is done in float64,
+# comparisons and logical operators produce boolean masks.
+class VectorEvaluator(ExpressionSolver):
+    def __init__(self):
+        self.__variables = {}
+        self.__functions = {}
+        self.__shared_values = []
+        for name, function in VECTOR_FUNCTIONS.items():
+            self.add_function(name, function)
+
+    def get_variables(self):
+        return self.__variables
+
+    def define(self, name, values):
+        self.__variables[name.lower()] = np.asarray(values, dtype=np.float64)
+        return self
+
+    def define_all(self, columns):
+        for name, values in columns.items():
+            self.define(name, values)
+        return self
+
+    def add_function(self, name, function):
+        self.__functions[name.lower()] = function
+        return self
+
+    def eval(self, expr):
+        return expr.accept(self)
+
+    def visit_assign_expr(self, expr):
+        value = self.eval(expr.value)
+        self.__variables[expr.name.lexeme.lower()] = value
+        return value
+
+    def visit_logical_expr(self, expr):
+        left = self.truthy(self.eval(expr.left))
+        right = self.truthy(self.eval(expr.right))
+
+        if expr.operator.type == TokenType.LOGICAL_OR:
+            return np.logical_or(left, right)
+        elif expr.operator.type == TokenType.LOGICAL_AND:
+            return np.logical_and(left, right)
+        else:
+            raise Exception(f"Invalid logical operator '{expr.operator.lexeme}'")
+
+    def visit_binary_expr(self, expr):
+        left = self.number(self.eval(expr.left))
+        right = self.number(self.eval(expr.right))
+
+        match expr.operator.type:
+            case TokenType.PLUS:
+                return left + right
+            case TokenType.MINUS:
+                return left - right
+            case TokenType.STAR:
+                return left * right
+            case TokenType.SLASH:
+                return left / right
+            case TokenType.MODULO:
+                # Decimal remainder takes the sign of the dividend, as fmod does
+                return np.fmod(left, right)
+            case TokenType.EXPONENT:
+                return np.power(left, right)
+            case TokenType.EQUAL:
+                return left == right
+            case TokenType.NOT_EQUAL:
+                return left != right
+            case TokenType.GREATER:
+                return left > right
+            case TokenType.GREATER_EQUAL:
+                return left >= right
+            case TokenType.LESS:
+                return left < right
+            case TokenType.LESS_EQUAL:
+                return left <= right
+            case _:
+                raise Exception(f"Invalid binary operator '{expr.operator.lexeme}'")
+
+    def visit_unary_expr(self, expr):
+        right = self.number(self.eval(expr.right))
+
+        match expr.operator.type:
+            case TokenType.MINUS:
+                return -right
+            case TokenType.SQUARE_ROOT:
+                return np.sqrt(right)
+            case _:
+                raise Exception("Invalid unary operator")
+
+    def visit_call_expr(self, expr):
+        name = expr.name
+        function = self.__functions.get(name.lower())
+        if function is None:
+            raise Exception(f"Undefined function '{name}'")
+        return function.call([self.number(self.eval(arg)) for arg in expr.arguments])
+
+    def visit_literal_expr(self, expr):
+        return np.float64(expr.value)
+
+    def visit_variable_expr(self, expr):
+        name = expr.name.lexeme
+        value = self.__variables.get(name.lower())
+        if value is None:
+            raise Exception(f"Undefined variable '{name}'")
+        return value
+
+    def visit_grouping_expr(self, expr):
+        return self.eval(expr.expression)
+
+    def visit_shared_expr(self, expr):
+        value = self.__shared_values[expr.index]
+        if value is None:
+            value = self.eval(expr.expression)
+            self.__shared_values[expr.index] = value
+        return value
+
+    def visit_optimized_expr(self, expr):
+        outer_values = self.__shared_values
+        self.__shared_values = [None] * expr.shared_count
+        try:
+            return self.eval(expr.expression)
+        finally:
+            self.__shared_values = outer_values
+
+    # Masks take part in arithmetic as 0 and 1, the same way Evaluator returns Decimal(0) and Decimal(1)
+    def number(self, value):
+        if value.dtype == np.bool_:
+            return value.astype(np.float64)
+        return value
+
+    def truthy(self, value):
+        if value.dtype == np.bool_:
+            return value
+        return value != 0
+
+
+class ElementwiseFunction(Function):
+    def __init__(self, name, function, min_arguments, max_arguments=None):
+        self.name = name
+        self.function = function
+        self.min_arguments = min_arguments
+        self.max_arguments = max_arguments
+
+    def call(self, arguments):
+        if len(arguments) < self.min_arguments or \
+                (self.max_arguments is not None and len(arguments) > self.max_arguments):
+            raise Exception(f"Invalid number of arguments for {self.name}")
+        return self.function(*arguments)
+
+
+def _round(value, scale=0):
+    if np.ndim(scale) != 0:
+        raise Exception("round requires a constant scale")
+    return np.round(value, int(scale))
+
+
+# Element-wise counterparts of the functions registered in EvaluatorWrapper
+VECTOR_FUNCTIONS = {
+    "abs": ElementwiseFunction("abs", np.abs, 1, 1),
+    "sum": ElementwiseFunction("sum", lambda *args: reduce(np.add, args), 1),
+    "floor": ElementwiseFunction("floor", np.floor, 1, 1),
+    "ceil": ElementwiseFunction("ceil", np.ceil, 1, 1),
+    "round": ElementwiseFunction("round", _round, 1, 2),
+    "min": ElementwiseFunction("min", lambda *args: reduce(np.minimum, args), 1),
+    "max": ElementwiseFunction("max", lambda *args: reduce(np.maximum, args), 1),
+    "sqrt": ElementwiseFunction("sqrt", np.sqrt, 1, 1),
+    "ln": ElementwiseFunction("ln", np.log, 1, 1),
+    "exp": ElementwiseFunction("exp", np.exp, 1, 1),
+}
@@ -0,0 +1,146 @@
+from PyQt5 import QtCore, QtGui, QtWidgets
+from PyQt5.QtCore import QAbstractListModel, QModelIndex, Qt, pyqtSignal
+
+# (text, ok) of the last evaluation of a formula; ok is False for errors and violated constraints
+RESULT_ROLE = Qt.UserRole + 1
+
+
+# Formula texts of the sheet F0, F1, ... and their results; a QListView shows only the rows that are on screen
+class FormulaListModel(QAbstractListModel):
+    # Emitted when the formulas change, but not when only the results do
+    formulas_edited = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super(FormulaListModel, self).__init__(parent)
+        self.__formulas = []
+        self.__results = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.__formulas)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == RESULT_ROLE:
+            return self.__results[index.row()] if index.row() < len(self.__results) else ("", True)
+        if role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        return self.__formulas[index.row()]
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        if self.__formulas[index.row()] != value:
+            self.__formulas[index.row()] = value
+            self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
+            self.formulas_edited.emit()
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def formulas(self):
+        return list(self.__formulas)
+
+    def set_formulas(self, formulas):
+        self.beginResetModel()
+        self.__formulas = list(formulas)
+        self.__results = []
+        self.endResetModel()
+        self.formulas_edited.emit()
+
+    # Results for the rows in order, as returned with RESULT_ROLE
+    def set_results(self, results):
+        self.__results = list(results)
+        if self.__formulas:
+            self.dataChanged.emit(self.index(0), self.index(len(self.__formulas) - 1), [RESULT_ROLE])
+
+    # Returns the index of the new row
+    def append_formula(self, formula=""):
+        row = len(self.__formulas)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.__formulas.append(formula)
+        self.endInsertRows()
+        self.formulas_edited.emit()
+        return self.index(row)
+
+
+# Paints a row as "F<sub>i</sub> ↔ formula" with the result on the right, and edits the formula in a QLineEdit
+# placed after the label. Every keystroke in the editor is written to the model, so the sheet can be re-evaluated while typing.
+class FormulaDelegate(QtWidgets.QStyledItemDelegate):
+    def __init__(self, parent=None):
+        super(FormulaDelegate, self).__init__(parent)
+        self.__label_font = QtGui.QFont()
+        self.__label_font.setFamily("Arial")
+        self.__label_font.setPointSize(12)
+        self.__index_font = QtGui.QFont(self.__label_font)
+        self.__index_font.setPointSize(8)
+        self.__formula_font = QtGui.QFont()
+        self.__formula_font.setFamily("Cambria Math")
+        self.__formula_font.setPointSize(12)
+
+    def sizeHint(self, option, index):
+        height = max(QtGui.QFontMetrics(self.__label_font).height(),
+                     QtGui.QFontMetrics(self.__formula_font).height())
+        return QtCore.QSize(option.rect.width(), height + 16)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        if option.state & QtWidgets.QStyle.State_Selected:
+            painter.fillRect(option.rect, option.palette.highlight())
+            painter.setPen(option.palette.color(QtGui.QPalette.HighlightedText))
+        rect = option.rect.adjusted(8, 0, -8, 0)
+        label_width = self.__label_width(index.row())
+        label_metrics = QtGui.QFontMetrics(self.__label_font)
+        baseline = rect.top() + (rect.height() + label_metrics.ascent() - label_metrics.descent()) // 2
+        painter.setFont(self.__label_font)
+        painter.drawText(rect.left(), baseline, "F")
+        x = rect.left() + label_metrics.horizontalAdvance("F")
+        painter.setFont(self.__index_font)
+        painter.drawText(x, baseline + label_metrics.descent(), str(index.row()))
+        x += QtGui.QFontMetrics(self.__index_font).horizontalAdvance(str(index.row()))
+        painter.setFont(self.__label_font)
+        painter.drawText(x, baseline, " ↔ ")
+        painter.setFont(self.__formula_font)
+        formula_metrics = QtGui.QFontMetrics(self.__formula_font)
+        text_rect = QtCore.QRect(rect.left() + label_width, rect.top(), rect.width() - label_width, rect.height())
+        result, ok = index.data(RESULT_ROLE)
+        if result:
+            # The result takes at most 40% of the row and the formula is elided before it
+            result = formula_metrics.elidedText(result, Qt.ElideRight, text_rect.width() * 2 // 5)
+            result_width = formula_metrics.horizontalAdvance(result)
+            text_rect.setWidth(text_rect.width() - result_width - 16)
+            painter.save()
+            if not ok:
+                painter.setPen(QtGui.QColor(Qt.darkRed))
+            painter.drawText(QtCore.QRect(rect.right() - result_width, rect.top(), result_width, rect.height()),
+                             Qt.AlignVCenter | Qt.AlignRight, result)
+            painter.restore()
+        text = formula_metrics.elidedText(index.data(), Qt.ElideRight, text_rect.width())
+        painter.drawText(text_rect, Qt.AlignVCenter | Qt.AlignLeft, text)
+        painter.restore()
+
+    def createEditor(self, parent, option, index):
+        editor = QtWidgets.QLineEdit(parent)
+        editor.setClearButtonEnabled(True)
+        editor.setFont(self.__formula_font)
+        editor.textEdited.connect(lambda: self.commitData.emit(editor))
+        return editor
+
+    def setEditorData(self, editor, index):
+        if editor.text() != index.data():
+            editor.setText(index.data())
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.text(), Qt.EditRole)
+
+    def updateEditorGeometry(self, editor, option, index):
+        label_width = self.__label_width(index.row())
+        editor.setGeometry(option.rect.adjusted(8 + label_width, 4, -8, -4))
+
+    def __label_width(self, row):
+        label_metrics = QtGui.QFontMetrics(self.__label_font)
+        return label_metrics.horizontalAdvance("F") + label_metrics.horizontalAdvance(" ↔ ") + \
+            QtGui.QFontMetrics(self.__index_font).horizontalAdvance(str(row))
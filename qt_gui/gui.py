@@ -1,68 +1,90 @@
-from PyQt5 import QtWidgets, QtGui, QtCore
+from PyQt5 import QtWidgets, QtGui
+from PyQt5.QtCore import QThreadPool, QTimer
 from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QMessageBox
 from PyQt5.uic import loadUi
+from concurrent.futures import ThreadPoolExecutor
+import html
+import os
 import sys
 
 from expression_processor.evaluator_wrapper import EvaluatorWrapper
-from expression_processor.parsing_tasks import check_for_constraint
-from samples_processor.samples_processing import fun_mnk
-from samples_processor.samples_processing import Main
+from expression_processor.formula_sheet import FormulaSheet, read_formulas, write_formulas
+from samples_processor.formula_processing import Main
+from qt_gui.formula_list import FormulaDelegate, FormulaListModel
+from qt_gui.workers import Task
 
 
 class MainUI(QMainWindow):
-    __formula_count = 0
-    __list_of_widgets = []
-
     def __init__(self):
         super(MainUI, self).__init__()
+        # Variables assigned in one formula are visible to every formula that reads them. The sheet keeps the
+        # parsed formulas and their values, so an edit re-evaluates only the formulas it affects.
+        self.__sheet = FormulaSheet()
+        # The sheet is only used from the evaluation thread, so its updates run one after another;
+        # fits run in parallel
+        self.__evaluation_pool = QThreadPool(self)
+        self.__evaluation_pool.setMaxThreadCount(1)
+        # Formulas of one level of the sheet do not depend on each other; the evaluation thread hands them
+        # to these threads
+        self.__sheet_executor = ThreadPoolExecutor(os.cpu_count() or 1)
+        self.__fit_pool = QThreadPool.globalInstance()
+        # Running fits -> last reported progress
+        self.__fits = {}
+        self.__evaluations = []
+        # Formulas are re-evaluated a moment after the last keystroke
+        self.__evaluation_timer = QTimer(self)
+        self.__evaluation_timer.setSingleShot(True)
+        self.__evaluation_timer.setInterval(250)
+        self.__evaluation_timer.timeout.connect(self.__evaluate)
         loadUi("qt_gui/main_window.ui", self)
         self.resize(1280, 720)
         self.setWindowIcon(QtGui.QIcon('qt_gui/icon.ico'))
         self.setWindowTitle("Средство функционального проектирования")
         self.evaluate_pb.clicked.connect(self.__evaluate)
         self.add_expression_pb.clicked.connect(self.__add_expression)
+        self.load_formulas_pb.clicked.connect(self.__load_formulas)
+        self.save_formulas_pb.clicked.connect(self.__save_formulas)
         self.select_file_pb.clicked.connect(self.show_dialog)
         self.evaluate_pb_.clicked.connect(self.__evaluate_MNK)
 
-        # Remove demo widget
-        while self.formula_hl_demo.count():
-            item = self.formula_hl_demo.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-        self.verticalLayout_9.removeItem(self.formula_hl_demo)
-        del self.formula_hl_demo
+        # Formula list; editors are created only for the row being edited
+        self.__formulas = FormulaListModel(self)
+        self.formula_list.setModel(self.__formulas)
+        self.formula_list.setItemDelegate(FormulaDelegate(self.formula_list))
+        self.__formulas.formulas_edited.connect(self.__evaluation_timer.start)
 
         # Add first formula
-        self.__add_expression()
+        self.__formulas.append_formula()
 
-        # Other
-        self.verticalLayout_9.setSpacing(8)
+        # Progress of the running fits
+        self.fit_progress = QtWidgets.QProgressBar()
+        self.cancel_fits_pb = QtWidgets.QPushButton("Отменить")
+        self.cancel_fits_pb.clicked.connect(self.__cancel_fits)
+        fit_progress_hl = QtWidgets.QHBoxLayout()
+        fit_progress_hl.addWidget(self.fit_progress)
+        fit_progress_hl.addWidget(self.cancel_fits_pb)
+        self.leftLayout_3.addLayout(fit_progress_hl)
+        self.__update_fit_progress()
 
     def __evaluate(self):
-        self.clear_label()
-        formulas = []
-        for i in range(len(self.__list_of_widgets)):
-            lineEdit = self.__list_of_widgets[i]
-            formulas.append(lineEdit.text())
-        for i in range(len(formulas)):
-            formula = formulas[i]
-            answer = Main().process_formula(formula)
-            if answer is None:
-                if self.__list_of_widgets[i].text() == "":
-                    pass
-                else:
-                    self.print_to_label(f"F<sub>{i}</sub> имеет неверный формат")
-            else:
-                if check_for_constraint(formula):
-                    if bool(answer):
-                        substr = "Истина"
-                    else:
-                        substr = "Ложь"
-                    self.print_to_label(f"F<sub>{i}(ограничение)</sub> = {substr}")
-                else:
-                    self.print_to_label(f"F<sub>{i}</sub> = {answer}")
+        formulas = self.__formulas.formulas()
+        self.__evaluation_timer.stop()
+        task = Task(_evaluate_sheet, self.__sheet, formulas, self.__sheet_executor)
+        task.signals.finished.connect(lambda lines: self.__show_evaluation(task, lines))
+        task.signals.failed.connect(lambda error: self.__evaluation_failed(task, error))
+        self.__evaluations.append(task)
+        self.__evaluation_pool.start(task)
+
+    def __show_evaluation(self, task, evaluation):
+        self.__evaluations.remove(task)
+        results, lines = evaluation
+        self.__formulas.set_results(results)
+        self.answer_label.setText("".join(line + "<br>" for line in lines))
+
+    def __evaluation_failed(self, task, error):
+        self.__evaluations.remove(task)
+        self.show_error("Ошибка при вычислении формул: " + error)
 
     def print_to_label(self, obj):
         prev_text = self.answer_label.text()
@@ -86,37 +108,30 @@ class MainUI(QMainWindow):
         self.answer_label.setText("")
 
     def __add_expression(self):
-        if (self.__formula_count >= 32):
-            return
-        formula_hl = QtWidgets.QHBoxLayout()
-        formula_hl.setSpacing(8)
-        formula_hl.setObjectName("formula_hl" + str(self.__formula_count))
-        label = QtWidgets.QLabel()
-        font = QtGui.QFont()
-        font.setFamily("Arial")
-        font.setPointSize(12)
-        label.setFont(font)
-        label.setObjectName("label_" + str(self.__formula_count))
-        label.setText("F<sub>" + str(self.__formula_count) + "</sub> ↔ ")
-        formula_hl.addWidget(label)
-        lineEdit = QtWidgets.QLineEdit(self.scrollAreaWidgetContents_3)
-        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Fixed)
-        sizePolicy.setHorizontalStretch(0)
-        sizePolicy.setVerticalStretch(0)
-        sizePolicy.setHeightForWidth(lineEdit.sizePolicy().hasHeightForWidth())
-        lineEdit.setSizePolicy(sizePolicy)
-        lineEdit.setMaximumSize(QtCore.QSize(16777215, 40))
-        lineEdit.setClearButtonEnabled(True)
-        font = QtGui.QFont()
-        font.setFamily("Cambria Math")
-        font.setPointSize(12)
-        lineEdit.setFont(font)
-        lineEdit.setCursor(QtGui.QCursor(QtCore.Qt.IBeamCursor))
-        lineEdit.setObjectName("lineEdit_" + str(self.__formula_count))
-        formula_hl.addWidget(lineEdit)
-        self.__list_of_widgets.append(lineEdit)
-        self.__formula_count += 1
-        self.verticalLayout_9.addLayout(formula_hl)
+        index = self.__formulas.append_formula()
+        self.formula_list.setCurrentIndex(index)
+        self.formula_list.edit(index)
+
+    def __load_formulas(self):
+        fileName, _ = QFileDialog.getOpenFileName(self, "Открыть формулы", "",
+                                                  "Текстовые файлы (*.txt);;Все файлы (*)")
+        if fileName:
+            try:
+                formulas = read_formulas(fileName)
+            except Exception as e:
+                self.show_error("Ошибка при открытии файла: " + str(e))
+                return
+            self.__formulas.set_formulas(formulas if formulas else [""])
+            self.__evaluate()
+
+    def __save_formulas(self):
+        fileName, _ = QFileDialog.getSaveFileName(self, "Сохранить формулы", "",
+                                                  "Текстовые файлы (*.txt);;Все файлы (*)")
+        if fileName:
+            try:
+                write_formulas(fileName, self.__formulas.formulas())
+            except Exception as e:
+                self.show_error("Ошибка при сохранении файла: " + str(e))
 
     def __evaluate_MNK(self):
         formula = self.lineEdit_10.text()
@@ -125,18 +140,58 @@ class MainUI(QMainWindow):
             parts = Main().process_mnk(formula)
         except Exception as e:
             self.show_error("Ошибка при распознавании формата формулы: " + str(e))
+            return
 
         if filename != "":
-            try:
-                coefs = fun_mnk(filename, formula)
-                str1 = ""
-                print(coefs)
-                for i in range(len(coefs) - 1):
-                    str1 += f"a{i} = {coefs[i]}" + '<br>'
-                str1 += f"Свободный член = {coefs[-1]}" + '<br>'
-                self.result_label.setText(str1)
-            except Exception as e:
-                self.show_error("Ошибка при расчете коэффициентов линейной регрессии: " + str(e))
+            task = Task(_fit_mnk, filename, formula)
+            task.signals.progress.connect(lambda percent: self.__fit_progressed(task, percent))
+            task.signals.finished.connect(lambda model: self.__show_fit(task, formula, model))
+            task.signals.failed.connect(lambda error: self.__fit_failed(task, error))
+            task.signals.cancelled.connect(lambda: self.__fit_done(task))
+            self.__fits[task] = 0
+            self.__update_fit_progress()
+            self.__fit_pool.start(task)
+
+    def __fit_progressed(self, task, percent):
+        if task in self.__fits:
+            self.__fits[task] = percent
+            self.__update_fit_progress()
+
+    def __fit_done(self, task):
+        del self.__fits[task]
+        self.__update_fit_progress()
+
+    def __show_fit(self, task, formula, model):
+        self.__fit_done(task)
+        coefs = model.formula_coefficients
+        str1 = formula + '<br>'
+        print(coefs)
+        for i in range(len(coefs) - 1):
+            str1 += f"a{i} = {coefs[i]}" + '<br>'
+        str1 += f"Свободный член = {coefs[-1]}" + '<br>'
+        self.result_label.setText(str1)
+        # matplotlib windows belong to the main thread
+        from samples_processor.samples_processing import make_plot
+        make_plot(model.evaluation.predictions, model.evaluation.observed)
+
+    def __fit_failed(self, task, error):
+        self.__fit_done(task)
+        self.show_error("Ошибка при расчете коэффициентов линейной регрессии: " + error)
+
+    # A fit stops at its next progress report. fit_mnk reports after every chunk when streaming, but the
+    # in-memory fit only between its stages (loading, transforming, solving), so cancelling it waits for the
+    # current stage to finish
+    def __cancel_fits(self):
+        for task in self.__fits:
+            task.cancel()
+
+    # One bar for all running fits, hidden when there are none
+    def __update_fit_progress(self):
+        running = len(self.__fits) > 0
+        self.fit_progress.setVisible(running)
+        self.cancel_fits_pb.setVisible(running)
+        if running:
+            self.fit_progress.setValue(sum(self.__fits.values()) // len(self.__fits))
 
     def show_error(self, error_text):
         msg_box = QMessageBox()
@@ -144,3 +199,43 @@ class MainUI(QMainWindow):
         msg_box.setText(error_text)
         msg_box.setWindowTitle("Ошибка")
         msg_box.exec_()
+
+
+# Runs on the evaluation thread: brings the sheet up to date with the formulas. Returns the result of every
+# formula for the formula list, and the lines for answer_label: constraints and formulas without a value,
+# so the label stays short however long the sheet is.
+def _evaluate_sheet(sheet, formulas, executor, progress):
+    sheet.set_formulas(formulas)
+    sheet.update(executor)
+    progress(100)
+    results = []
+    lines = []
+    for i in range(len(sheet)):
+        cell = sheet.cell(i)
+        if cell.value is None:
+            if cell.is_empty():
+                results.append(("", True))
+            elif cell.parse_error is None:
+                # Cycles, variables assigned twice and undefined variables
+                results.append((cell.error, False))
+                lines.append(f"F<sub>{i}</sub>: {html.escape(cell.error, quote=False)}")
+            else:
+                results.append(("неверный формат", False))
+                lines.append(f"F<sub>{i}</sub> имеет неверный формат")
+        else:
+            if cell.constraint:
+                if bool(cell.value):
+                    substr = "Истина"
+                else:
+                    substr = "Ложь"
+                results.append((substr, bool(cell.value)))
+                lines.append(f"F<sub>{i}(ограничение)</sub> = {substr}")
+            else:
+                results.append((f"= {cell.value}", True))
+    return results, lines
+
+
+# Runs on a fit thread; numpy, scipy and matplotlib are loaded on the first fit rather than at startup
+def _fit_mnk(filename, formula, progress):
+    from samples_processor.samples_processing import fit_mnk
+    return fit_mnk(filename, formula, progress=progress)
@@ -0,0 +1,53 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+# Signals of a Task; they are delivered in the thread of the receiving widgets, i.e. on the main thread
+class TaskSignals(QObject):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+
+# Runs function(*args, progress=..., **kwargs) on a QThreadPool thread and reports the outcome by signals.
+# The function should call progress(percent) now and then: besides emitting the progress signal, that is
+# where a cancelled task stops (progress raises TaskCancelled). Widgets and plots must not be touched from
+# the function, only from the slots connected to the signals.
+class Task(QRunnable):
+    def __init__(self, function, *args, **kwargs):
+        super(Task, self).__init__()
+        self.signals = TaskSignals()
+        self.__function = function
+        self.__args = args
+        self.__kwargs = kwargs
+        self.__cancel_requested = threading.Event()
+        # The owner keeps the task until one of the final signals arrives
+        self.setAutoDelete(False)
+
+    def cancel(self):
+        self.__cancel_requested.set()
+
+    def is_cancelled(self):
+        return self.__cancel_requested.is_set()
+
+    def report_progress(self, percent):
+        if self.__cancel_requested.is_set():
+            raise TaskCancelled()
+        self.signals.progress.emit(int(percent))
+
+    def run(self):
+        try:
+            self.report_progress(0)
+            result = self.__function(*self.__args, progress=self.report_progress, **self.__kwargs)
+        except TaskCancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+        else:
+            self.signals.finished.emit(result)
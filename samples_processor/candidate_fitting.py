@@ -0,0 +1,149 @@
+from concurrent.futures import ProcessPoolExecutor
+import math
+
+import numpy as np
+
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+from expression_processor.tokenizer import token_list_to_string
+from samples_processor.samples_processing import Main, FittedModel, ModelEvaluation, open_samples, match_terms, \
+    order_coefficients
+
+
+# Fit of one candidate formula; model and the statistics are None if the formula could not be fitted
+class CandidateFit:
+    def __init__(self, expression, model=None, error=None):
+        self.expression = expression
+        self.model = model
+        self.error = error
+        self.r2 = None
+        self.rmse = None
+        self.aic = None
+        self.bic = None
+        if model is not None:
+            self.r2 = model.evaluation.r2
+            self.rmse = model.evaluation.rmse
+
+    def __str__(self):
+        if self.model is None:
+            return f"{self.expression}: {self.error}"
+        return f"BIC {self.bic:.6g}, AIC {self.aic:.6g}, R2 {self.r2:.6g}, RMSE {self.rmse:.6g}: {self.expression}"
+
+
+# Fits every candidate formula against one sample file and returns the fits ranked by BIC (best first,
+# failed candidates last). The samples are loaded once, every distinct term column (such as "1*x1^2") is
+# evaluated once for all candidates, and a single centered Gram matrix of all columns is accumulated;
+# each candidate is then solved from its block of that matrix.
+# With processes > 1 the rows are split between worker processes, which read the memory-mapped
+# sample cache and return partial Gram matrices.
+def fit_candidates(filename, expressions, processes=None, chunk_rows=65536):
+    try:
+        header, samples = open_samples(filename)
+    except Exception as e:
+        raise Exception(f"Неверный формат файла ({type(e).__name__}: {str(e)})")
+    params_order = header[:-1]
+    y_param_name = header[-1]
+    rows = len(samples)
+
+    # Source of every distinct column -> its index in the Gram matrix
+    column_index = {}
+    candidates = []
+    ew = EvaluatorWrapper()
+    # New term columns are tried on the first rows, so that one broken candidate does not stop the others
+    probe = {header[i]: samples[:1, i] for i in range(len(header))}
+    for expression in expressions:
+        try:
+            res = Main().process_mnk(expression)
+            if res is None:
+                raise Exception("Формула должна иметь вид y = a0 * ... + a1 * ...")
+            actions_list, swap_order = match_terms(params_order, res)
+            candidate_sources = []
+            for param in params_order:
+                source = param
+                for given_param, term_tokens in actions_list:
+                    if given_param == param:
+                        source = token_list_to_string(term_tokens[:-1])
+                if source not in column_index:
+                    ew.eval_vectorized(source, probe)
+                candidate_sources.append(source)
+        except Exception as e:
+            candidates.append((expression, None, None, None, str(e)))
+            continue
+        indices = [column_index.setdefault(source, len(column_index)) for source in candidate_sources]
+        candidates.append((expression, actions_list, swap_order, indices, None))
+
+    sources = list(column_index)
+    # Columns are shifted by their means over the first rows, so the sums of squares do not cancel out
+    shift = term_columns(samples[:min(rows, 1024)], header, sources).mean(axis=0) if rows else None
+    sums, gram = _gram(filename, samples, header, sources, shift, processes, chunk_rows)
+    means = shift + sums / rows
+    centered = gram - np.outer(sums, sums) / rows
+    y = len(sources)
+
+    fits = []
+    for expression, actions_list, swap_order, indices, error in candidates:
+        if error is not None:
+            fits.append(CandidateFit(expression, error=error))
+            continue
+        block = centered[np.ix_(indices, indices)]
+        coefs = np.linalg.lstsq(block, centered[indices, y], rcond=None)[0]
+        intercept = float(means[y] - means[indices] @ coefs)
+        ss_res = max(float(centered[y, y] - coefs @ centered[indices, y]), 0.0)
+        model = FittedModel(params_order, y_param_name, actions_list, coefs, intercept, ew)
+        model.formula_coefficients = order_coefficients(params_order, swap_order, coefs, intercept)[0]
+        model.evaluation = ModelEvaluation.from_sums(rows, ss_res, float(centered[y, y]))
+        fit = CandidateFit(expression, model)
+        # Intercept is counted as a parameter; a perfect fit gets -inf
+        k = len(indices) + 1
+        log_likelihood_term = rows * math.log(ss_res / rows) if ss_res > 0 else -math.inf
+        fit.aic = log_likelihood_term + 2 * k
+        fit.bic = log_likelihood_term + k * math.log(rows)
+        fits.append(fit)
+    fits.sort(key=lambda fit: (fit.model is None, fit.bic if fit.model is not None else 0))
+    return fits
+
+
+def print_candidate_table(fits):
+    for i in range(len(fits)):
+        print(f"{i + 1}. {fits[i]}")
+
+
+# Term columns followed by the observed column for some rows of the samples
+def term_columns(samples, header, sources):
+    columns = {header[i]: samples[:, i] for i in range(len(header))}
+    ew = EvaluatorWrapper()
+    block = np.empty((len(samples), len(sources) + 1))
+    for j in range(len(sources)):
+        block[:, j] = ew.eval_vectorized(sources[j], columns)
+    block[:, -1] = samples[:, -1]
+    return block
+
+
+# Sums and Gram matrix of the shifted columns of rows [start, stop)
+def _partial_gram(samples, header, sources, shift, start, stop, chunk_rows):
+    sums = np.zeros(len(sources) + 1)
+    gram = np.zeros((len(sources) + 1, len(sources) + 1))
+    for chunk_start in range(start, stop, chunk_rows):
+        block = term_columns(samples[chunk_start:min(chunk_start + chunk_rows, stop)], header, sources)
+        block -= shift
+        sums += block.sum(axis=0)
+        gram += block.T @ block
+    return sums, gram
+
+
+def _partial_gram_of_file(filename, sources, shift, start, stop, chunk_rows):
+    header, samples = open_samples(filename)
+    return _partial_gram(samples, header, sources, shift, start, stop, chunk_rows)
+
+
+def _gram(filename, samples, header, sources, shift, processes, chunk_rows):
+    rows = len(samples)
+    if rows == 0:
+        raise Exception("No samples to fit")
+    if not processes or processes < 2:
+        return _partial_gram(samples, header, sources, shift, 0, rows, chunk_rows)
+    bounds = np.linspace(0, rows, processes + 1).astype(int)
+    with ProcessPoolExecutor(processes) as executor:
+        parts = [executor.submit(_partial_gram_of_file, filename, sources, shift, bounds[i], bounds[i + 1], chunk_rows)
+                 for i in range(processes) if bounds[i] < bounds[i + 1]]
+        results = [part.result() for part in parts]
+    return sum(result[0] for result in results), sum(result[1] for result in results)
@@ -0,0 +1,114 @@
+from concurrent.futures import ProcessPoolExecutor
+import html
+import io
+
+REPORT_FORMATS = ("png", "svg", "html")
+
+
+# Observed-vs-predicted scatter with the y = x line
+def draw_fit_plot(axes, predicted_values, observed_values):
+    # Large sample files would make the SVG huge, so the points are rasterized and only the axes stay vector
+    axes.scatter(predicted_values, observed_values, color='blue', label='Observed vs Predicted', rasterized=True)
+
+    # Добавление линии y=x для наглядности
+    max_val = max(max(predicted_values), max(observed_values))
+    axes.plot([0, max_val], [0, max_val], color='red', linestyle='--', label='y=x')
+
+    # Настройка заголовка и подписей осей
+    axes.set_title('Предсказанные и наблюдаемые значения')
+    axes.set_xlabel('Предсказанное значение')
+    axes.set_ylabel('Наблюдаемое значение')
+    axes.legend()
+    axes.grid(True)
+
+
+# The plot on its own Agg canvas; unlike pyplot this needs no display and keeps no global figure state,
+# so it can be rendered from any thread or process
+def render_fit_figure(predicted_values, observed_values):
+    # matplotlib is imported on the first report, not with the fitting code
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(10, 6))
+    FigureCanvasAgg(figure)
+    draw_fit_plot(figure.add_subplot(), predicted_values, observed_values)
+    return figure
+
+
+# Writes the plot and the statistics of a fit to <prefix>.png, <prefix>.svg and <prefix>.html (any subset of
+# REPORT_FORMATS). evaluation is a ModelEvaluation with observed values, coefficients maps names to values.
+# Returns the written file names.
+def write_report(prefix, evaluation, coefficients, title="", formats=REPORT_FORMATS):
+    unknown = [fmt for fmt in formats if fmt not in REPORT_FORMATS]
+    if unknown:
+        raise Exception(f"Unknown report format: {', '.join(unknown)}")
+    figure = render_fit_figure(evaluation.predictions, evaluation.observed)
+    if title:
+        figure.suptitle(title)
+    written = []
+    svg = None
+    if "svg" in formats or "html" in formats:
+        buffer = io.StringIO()
+        figure.savefig(buffer, format="svg")
+        svg = buffer.getvalue()
+    if "png" in formats:
+        figure.savefig(f"{prefix}.png", format="png")
+        written.append(f"{prefix}.png")
+    if "svg" in formats:
+        with open(f"{prefix}.svg", "w", encoding="utf-8") as file:
+            file.write(svg)
+        written.append(f"{prefix}.svg")
+    if "html" in formats:
+        with open(f"{prefix}.html", "w", encoding="utf-8") as file:
+            file.write(_html_report(evaluation, coefficients, title, svg))
+        written.append(f"{prefix}.html")
+    return written
+
+
+def _html_report(evaluation, coefficients, title, svg):
+    rows = [("Число образцов", len(evaluation.observed)), ("R2", evaluation.r2), ("RMSE", evaluation.rmse)]
+    rows += list(coefficients.items())
+    table = "\n".join(f"<tr><td>{html.escape(str(name))}</td><td>{html.escape(str(value))}</td></tr>"
+                      for name, value in rows)
+    # The SVG starts with an XML declaration that is not allowed inside HTML
+    svg = svg[svg.index("<svg"):]
+    return (f"<!DOCTYPE html>\n<html>\n<head>\n<meta charset=\"utf-8\">\n<title>{html.escape(title)}</title>\n"
+            f"</head>\n<body>\n<h1>{html.escape(title)}</h1>\n<table>\n{table}\n</table>\n{svg}\n</body>\n</html>\n")
+
+
+# Writes reports in worker processes, so fitting goes on while the previous fits are being rendered.
+# submit() returns a Future with the written file names; close() (or leaving a with block) waits for all
+# reports and raises the first rendering error.
+class ReportWriter:
+    def __init__(self, processes=1):
+        self.__executor = ProcessPoolExecutor(processes)
+        self.__futures = []
+
+    def submit(self, prefix, evaluation, coefficients, title="", formats=REPORT_FORMATS):
+        future = self.__executor.submit(write_report, prefix, evaluation, coefficients, title, formats)
+        self.__futures.append(future)
+        return future
+
+    # Waits for the submitted reports and returns the names of all written files
+    def wait(self):
+        futures = self.__futures
+        self.__futures = []
+        written = []
+        for future in futures:
+            written += future.result()
+        return written
+
+    def close(self):
+        try:
+            return self.wait()
+        finally:
+            self.__executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.__executor.shutdown(cancel_futures=True)
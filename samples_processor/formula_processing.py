@@ -0,0 +1,85 @@
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+from expression_processor.tokenizer import TokenType, Tokenizer
+
+
+# Formula evaluation and MNK formula checks. Kept apart from samples_processing so that it can be used
+# without loading numpy, scipy and matplotlib.
+class Main:
+    def __init__(self, ew=None):
+        # Formulas evaluated by one Main share variables; separate instances do not
+        self.ew = ew if ew is not None else EvaluatorWrapper()
+
+    def print_formulas(formulas):
+        for i in range(len(formulas)):
+            print(f"F{i}: '{formulas[i]}'")
+        return 0
+
+    def process_formula(self, formula):
+        answer = None
+        try:
+            answer = self.ew.eval(formula)
+        except Exception as e:
+            print("process_formula exception:" + str(e))
+        return answer
+
+    def print_tokens(self, tokens):
+        i = 0
+        for t in tokens:
+            print(str(i) + ". " + str(t))
+            i += 1
+
+    def process_mnk(self, formula):
+        result = None
+        try:
+            sc = Tokenizer(formula)
+            tokens = sc.parse_tokens()
+            # self.print_tokens(tokens)
+            result = self.check_for_MNK_formula(tokens)
+        except Exception as e:
+            raise Exception("process_MNK exception: " + str(e))
+        return result
+
+    # Примем, что выражение должно содержать параметры, имеющие название a1, a2, a3, ... и т.д. и никак иначе
+    # Нужны коэффициенты при параметрах a1, a2, a3 и свободный коэффициент
+    def check_for_MNK_formula(self, tokens):
+        count_assign = 0
+        params_count = 0
+        for t in tokens:
+            if t.type == TokenType.ASSIGN:
+                count_assign += 1
+        # Ensure that formula looks like this:
+        # y = ...
+        if not ((tokens[0].type == TokenType.IDENTIFIER) and (tokens[1].type == TokenType.ASSIGN) and (
+                count_assign == 1)):
+            print("Errcode 1")
+            return None
+        parts = []
+        p = []
+        for i in range(2, len(tokens)):
+            t = tokens[i]
+            # print(t.__str__())
+
+            if i == 2 or (t.type != TokenType.PLUS and t.type != TokenType.MINUS):
+                p.append(t)
+            else:
+                parts.append(p)
+                p = []
+                if t.type == TokenType.MINUS:
+                    p.append(t)
+        parts.append(p)
+        parts[-1] = parts[-1][:-1]  # Удаляем EOF
+        # Check parts
+        for i in range(len(parts)):
+            # Первый токен должен быть идентификатором с именем a0, далее a1, a2 и т.д.
+            if parts[i][0].type == TokenType.IDENTIFIER:
+                first_identificator = parts[i][0]
+            else:
+                first_identificator = parts[i][1]
+            if first_identificator.type != TokenType.IDENTIFIER:
+                raise Exception("Первый токен должен быть идентификатором")
+                return None
+            if first_identificator.lexeme != f"a{i}":
+                raise Exception("Значения параметров должны соответствовать шаблону a0, a1, a2 и так далее")
+                # print("Значения параметров должны соответствовать шаблону a0, a1, a2 и так далее")
+                return None
+        return parts
\ No newline at end of file
@@ -0,0 +1,115 @@
+import numpy as np
+from scipy import sparse
+from scipy.linalg import LinAlgError, cho_factor, cho_solve, lapack
+from scipy.sparse.linalg import LinearOperator, lsqr
+
+from samples_processor.streaming_regression import StreamingLeastSquares
+
+# The normal equations lose about log10(cond(x)^2) digits, so beyond cond(x) ~ sqrt(1 / eps) they
+# no longer give the coefficients to a useful accuracy
+_CHOLESKY_MAX_CONDITION = 1e7
+
+
+# Result of solve_least_squares. condition is the (estimated) condition number of the (centered) design
+# matrix for every method, rank the numerical rank of the design matrix when the method can tell
+class LeastSquaresSolution:
+    def __init__(self, coefficients, intercept, method, condition, rank):
+        self.coefficients = coefficients
+        self.intercept = intercept
+        self.method = method
+        self.condition = condition
+        self.rank = rank
+
+
+# Linear least squares y ~ intercept + x @ coefficients, minimising |residuals|^2 + ridge * |coefficients|^2.
+# Methods:
+#   qr        Householder QR of [x 1 y], fed block by block so the memory is bounded by block_rows x columns;
+#             falls back to the minimum-norm solution when the problem is worse conditioned than max_condition
+#   cholesky  normal equations x'x + ridge*I accumulated block by block; fastest, but squares the
+#             condition number, so it falls back to qr when the factorisation fails or cond(x) > 1e7
+#   lsqr      iterative solver for scipy.sparse design matrices, the centering for the intercept is
+#             applied implicitly so the matrix stays sparse
+#   auto      lsqr for sparse matrices and for large dense ones with few non-zeros, qr otherwise
+def solve_least_squares(x, y, fit_intercept=True, ridge=0.0, method="auto", max_condition=1e10,
+                        block_rows=16384, sparse_density=0.05):
+    if ridge < 0:
+        raise Exception("Ridge parameter must be non-negative")
+    y = np.asarray(y, dtype=np.float64).ravel()
+    if not sparse.issparse(x):
+        x = np.asarray(x, dtype=np.float64).reshape(len(y), -1)
+    if x.shape[0] == 0:
+        raise Exception("No samples to fit")
+    if method == "auto":
+        method = "qr"
+        if sparse.issparse(x):
+            method = "lsqr"
+        elif x.shape[1] >= 100 and np.count_nonzero(x) < sparse_density * x.size:
+            x = sparse.csc_array(x)
+            method = "lsqr"
+    match method:
+        case "qr":
+            return _solve_qr(x, y, fit_intercept, ridge, max_condition, block_rows)
+        case "cholesky":
+            return _solve_cholesky(x, y, fit_intercept, ridge, max_condition, block_rows)
+        case "lsqr":
+            return _solve_lsqr(x, y, fit_intercept, ridge)
+        case _:
+            raise Exception(f"Unknown least squares method '{method}'")
+
+
+def _dense(x):
+    return x.toarray() if sparse.issparse(x) else x
+
+
+def _solve_qr(x, y, fit_intercept, ridge, max_condition, block_rows):
+    solver = StreamingLeastSquares(x.shape[1], fit_intercept)
+    for start in range(0, x.shape[0], block_rows):
+        solver.add(_dense(x[start:start + block_rows]), y[start:start + block_rows])
+    coefficients, intercept = solver.solve(ridge, max_condition)
+    return LeastSquaresSolution(coefficients, intercept, "qr", solver.condition, solver.rank)
+
+
+def _solve_cholesky(x, y, fit_intercept, ridge, max_condition, block_rows):
+    columns = x.shape[1]
+    x_mean = np.zeros(columns)
+    y_mean = 0.0
+    if fit_intercept:
+        x_mean = np.asarray(x.mean(axis=0)).ravel()
+        y_mean = float(y.mean())
+    gram = np.zeros((columns, columns))
+    rhs = np.zeros(columns)
+    for start in range(0, x.shape[0], block_rows):
+        block = _dense(x[start:start + block_rows]) - x_mean
+        gram += block.T @ block
+        rhs += block.T @ (y[start:start + block_rows] - y_mean)
+    gram[np.diag_indices(columns)] += ridge
+    try:
+        factor, lower = cho_factor(gram)
+    except LinAlgError:
+        return _solve_qr(x, y, fit_intercept, ridge, max_condition, block_rows)
+    # The Cholesky factor has the singular values of x, so its condition number is cond(x)
+    rcond, _ = lapack.dtrcon(factor, norm='1', uplo='L' if lower else 'U', diag='N')
+    condition = 1 / rcond if rcond > 0 else np.inf
+    if condition > _CHOLESKY_MAX_CONDITION:
+        return _solve_qr(x, y, fit_intercept, ridge, max_condition, block_rows)
+    coefficients = cho_solve((factor, lower), rhs)
+    intercept = y_mean - float(x_mean @ coefficients)
+    return LeastSquaresSolution(coefficients, intercept, "cholesky", condition, columns)
+
+
+def _solve_lsqr(x, y, fit_intercept, ridge):
+    x = sparse.csr_array(x)
+    rows, columns = x.shape
+    x_mean = np.zeros(columns)
+    y_mean = 0.0
+    if fit_intercept:
+        x_mean = np.asarray(x.mean(axis=0)).ravel()
+        y_mean = float(y.mean())
+    # (x - 1 * x_mean) without densifying x
+    centered = LinearOperator((rows, columns), dtype=np.float64,
+                              matvec=lambda v: x @ v - float(x_mean @ v),
+                              rmatvec=lambda u: x.T @ u - x_mean * float(np.sum(u)))
+    result = lsqr(centered, y - y_mean, damp=np.sqrt(ridge), atol=1e-12, btol=1e-12, iter_lim=10 * columns + 100)
+    coefficients = result[0]
+    intercept = y_mean - float(x_mean @ coefficients)
+    return LeastSquaresSolution(coefficients, intercept, "lsqr", float(result[6]), None)
@@ -0,0 +1,143 @@
+import re
+
+import numpy as np
+
+from expression_processor.differentiator import Differentiator
+from expression_processor.expressionizer import AssignExpression, VariableExpression
+from expression_processor.expressionizer import walk
+from expression_processor.precedence_parser import make_expressionizer
+from expression_processor.tokenizer import Tokenizer
+from expression_processor.vector_evaluator import VectorEvaluator
+from samples_processor.fit_report import write_report
+from samples_processor.samples_processing import ModelEvaluation, open_samples, make_plot
+
+_COEFFICIENT = re.compile(r"a\d+")
+
+
+# Result of fit_mnk_nonlinear: coefficients in the order of coefficient_names (a0, a1, ...)
+class NonlinearFit:
+    def __init__(self, y_param_name, model, coefficient_names, coefficients, iterations, converged):
+        self.y_param_name = y_param_name
+        # Right-hand side of the formula
+        self.model = model
+        self.coefficient_names = coefficient_names
+        self.coefficients = coefficients
+        self.iterations = iterations
+        self.converged = converged
+        self.evaluation = None
+
+    def predict(self, columns):
+        evaluator = _make_evaluator(columns, self.coefficient_names, self.coefficients)
+        return np.broadcast_to(evaluator.number(evaluator.eval(self.model)), (len(next(iter(columns.values()))),))
+
+
+# Least squares for MNK formulas in which the coefficients a0, a1, ... may appear anywhere, such as
+# "y = a0 * V^a1" or "y = a0 / (1 + a1*M^2)". Uses Levenberg-Marquardt; the Jacobian columns are the
+# symbolic partial derivatives of the formula (Differentiator) evaluated over all samples at once.
+# initial_values maps coefficient names to starting values, the others start at 1.
+def fit_mnk_nonlinear(filename, expression, initial_values=None, max_iterations=200, tolerance=1e-10):
+    try:
+        header, samples = open_samples(filename)
+    except Exception as e:
+        raise Exception(f"Неверный формат файла ({type(e).__name__}: {str(e)})")
+    y_param_name, model = _parse_formula(expression)
+    coefficient_names = sorted({node.name.lexeme.lower() for node in walk(model)
+                                if isinstance(node, VariableExpression) and _COEFFICIENT.fullmatch(node.name.lexeme)},
+                               key=lambda name: int(name[1:]))
+    if not coefficient_names:
+        raise Exception("Формула должна содержать коэффициенты a0, a1, a2 и так далее")
+    derivatives = [Differentiator(name).derivative(model) for name in coefficient_names]
+
+    columns = {header[i]: samples[:, i] for i in range(len(header) - 1)}
+    observed = np.asarray(samples[:, -1], dtype=np.float64)
+    initial_values = {name.lower(): value for name, value in (initial_values or {}).items()}
+    coefficients = np.array([float(initial_values.get(name, 1.0)) for name in coefficient_names])
+    rows = len(observed)
+
+    def evaluate(values):
+        evaluator = _make_evaluator(columns, coefficient_names, values)
+        return evaluator, np.broadcast_to(evaluator.number(evaluator.eval(model)), (rows,))
+
+    evaluator, predictions = evaluate(coefficients)
+    residuals = observed - predictions
+    cost = float(residuals @ residuals)
+    if not np.isfinite(cost):
+        raise Exception("Формула не вычисляется при начальных значениях коэффициентов")
+    damping = 1e-3
+    scale = np.zeros(len(coefficient_names))
+    converged = False
+    iteration = 0
+    while iteration < max_iterations and not converged:
+        iteration += 1
+        jacobian = np.empty((rows, len(coefficient_names)))
+        for j in range(len(derivatives)):
+            jacobian[:, j] = np.broadcast_to(evaluator.number(evaluator.eval(derivatives[j])), (rows,))
+        if not np.all(np.isfinite(jacobian)):
+            raise Exception("Производные формулы не вычисляются при текущих значениях коэффициентов")
+        # One QR per iteration; every damping trial is then a small (coefficients x coefficients) problem
+        q, r = np.linalg.qr(jacobian)
+        projected = q.T @ residuals
+        scale = np.maximum(scale, np.linalg.norm(jacobian, axis=0))
+        scale[scale == 0] = 1.0
+        while True:
+            augmented = np.vstack([r, np.sqrt(damping) * np.diag(scale)])
+            step = np.linalg.lstsq(augmented, np.concatenate([projected, np.zeros(len(scale))]), rcond=None)[0]
+            candidate = coefficients + step
+            candidate_evaluator, candidate_predictions = evaluate(candidate)
+            candidate_residuals = observed - candidate_predictions
+            candidate_cost = float(candidate_residuals @ candidate_residuals)
+            if np.isfinite(candidate_cost) and candidate_cost <= cost:
+                break
+            damping *= 10
+            if damping > 1e16:
+                break
+        if damping > 1e16:
+            # No step reduces the residuals any more
+            converged = True
+            break
+        converged = np.linalg.norm(step) <= tolerance * (np.linalg.norm(coefficients) + tolerance) or \
+            cost - candidate_cost <= tolerance * cost
+        coefficients = candidate
+        evaluator, predictions, residuals, cost = \
+            candidate_evaluator, candidate_predictions, candidate_residuals, candidate_cost
+        damping = max(damping / 10, 1e-12)
+
+    fit = NonlinearFit(y_param_name, model, coefficient_names, coefficients, iteration, converged)
+    fit.evaluation = ModelEvaluation(np.array(predictions), observed)
+    return fit
+
+
+# plot, report and writer as in fun_mnk
+def fun_mnk_nonlinear(filename, expression, initial_values=None, plot=True, report=None, writer=None):
+    fit = fit_mnk_nonlinear(filename, expression, initial_values)
+    print("a0, a1, a2 ...:", fit.coefficients)
+    print(f"Iterations: {fit.iterations}, converged: {fit.converged}, R2: {fit.evaluation.r2}, "
+          f"RMSE: {fit.evaluation.rmse}")
+    if report is not None:
+        coefficients = dict(zip(fit.coefficient_names, (float(value) for value in fit.coefficients)))
+        if writer is not None:
+            writer.submit(report, fit.evaluation, coefficients, expression)
+        else:
+            write_report(report, fit.evaluation, coefficients, expression)
+    if plot:
+        make_plot(fit.evaluation.predictions, fit.evaluation.observed)
+    return list(fit.coefficients)
+
+
+# "y = <model>" -> (y, model)
+def _parse_formula(expression):
+    expr = make_expressionizer(Tokenizer(expression).parse_tokens()).parse_expression()
+    if not isinstance(expr, AssignExpression) or \
+            any(isinstance(node, AssignExpression) for node in walk(expr.value)):
+        raise Exception("Формула должна иметь вид y = ... с одним знаком '='")
+    return expr.name.lexeme, expr.value
+
+
+def _make_evaluator(columns, coefficient_names, coefficients):
+    evaluator = VectorEvaluator()
+    evaluator.define("pi", np.pi)
+    evaluator.define("e", np.e)
+    evaluator.define_all(columns)
+    for name, value in zip(coefficient_names, coefficients):
+        evaluator.define(name, value)
+    return evaluator
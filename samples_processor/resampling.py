@@ -0,0 +1,147 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from samples_processor.least_squares import solve_least_squares
+from samples_processor.samples_processing import Main, fit_mnk, open_samples, match_terms, order_coefficients
+
+
+# Coefficients in formula order (a0, a1, ..., intercept) with their bootstrap spread, and the
+# k-fold cross-validation error of the model
+class ResamplingResult:
+    def __init__(self, coefficient_names, estimates, replicates, confidence, fold_rmse, cv_rmse, cv_r2):
+        self.coefficient_names = coefficient_names
+        self.estimates = estimates
+        # One row of coefficients per bootstrap refit
+        self.replicates = replicates
+        self.confidence = confidence
+        self.intervals = []
+        self.standard_errors = []
+        if len(replicates):
+            tail = (1 - confidence) / 2 * 100
+            low, high = np.percentile(replicates, [tail, 100 - tail], axis=0)
+            self.intervals = list(zip(low, high))
+            self.standard_errors = list(replicates.std(axis=0, ddof=1)) if len(replicates) > 1 else []
+        self.fold_rmse = fold_rmse
+        self.cv_rmse = cv_rmse
+        self.cv_r2 = cv_r2
+
+    def __str__(self):
+        lines = []
+        for i in range(len(self.coefficient_names)):
+            line = f"{self.coefficient_names[i]} = {self.estimates[i]:.6g}"
+            if self.intervals:
+                low, high = self.intervals[i]
+                line += f", {self.confidence:.0%} CI [{low:.6g}, {high:.6g}]"
+            lines.append(line)
+        if self.cv_rmse is not None:
+            lines.append(f"CV RMSE {self.cv_rmse:.6g}, CV R2 {self.cv_r2:.6g}")
+        return "\n".join(lines)
+
+
+# Fits an MNK formula once, then refits it on `bootstraps` resamples (drawn with replacement) and on
+# `folds` train/test splits. With processes > 1 the refits run in a process pool; the transformed design
+# matrix is placed in shared memory once and every worker maps it instead of receiving a pickled copy.
+def resample_mnk(filename, expression, bootstraps=1000, folds=5, confidence=0.95, processes=None, seed=None,
+                 ridge=0.0):
+    model = fit_mnk(filename, expression, ridge=ridge)
+    header, samples = open_samples(filename)
+    params_order = header[:-1]
+    _, swap_order = match_terms(params_order, Main().process_mnk(expression))
+    data = np.empty((len(samples), len(params_order) + 1))
+    data[:, :-1] = model.transform(samples[:, :-1])
+    data[:, -1] = samples[:, -1]
+    if folds is not None and folds > len(data):
+        raise Exception("Число блоков кросс-валидации больше числа образцов")
+
+    seeds = np.random.SeedSequence(seed).spawn(2)
+    tasks = [("bootstrap", child) for child in seeds[0].spawn(bootstraps)]
+    if folds:
+        tasks += [("fold", fold, folds, seeds[1]) for fold in range(folds)]
+    if processes and processes > 1:
+        results = _run_in_pool(data, tasks, ridge, processes)
+    else:
+        results = _run_tasks(data, tasks, ridge)
+
+    def formula_order(column_coefficients):
+        return order_coefficients(params_order, swap_order, column_coefficients[:-1], column_coefficients[-1])[0]
+
+    replicates = np.array([formula_order(result) for result in results[:bootstraps]], dtype=np.float64)
+    fold_results = results[bootstraps:]
+    fold_rmse = []
+    cv_rmse = None
+    cv_r2 = None
+    if fold_results:
+        sse = sum(result[0] for result in fold_results)
+        fold_rmse = [float(np.sqrt(result[0] / result[1])) for result in fold_results]
+        cv_rmse = float(np.sqrt(sse / len(data)))
+        observed = data[:, -1]
+        ss_tot = float(((observed - observed.mean()) ** 2).sum())
+        cv_r2 = 1 - sse / ss_tot if ss_tot != 0 else float("nan")
+    names = [f"a{i}" for i in range(len(params_order))] + ["intercept"]
+    estimates = [float(value) for value in model.formula_coefficients]
+    return ResamplingResult(names, estimates, replicates.reshape(len(replicates), len(names)), confidence,
+                            fold_rmse, cv_rmse, cv_r2)
+
+
+# Normal equations are the cheapest refit; solve_least_squares switches to qr for resamples that are too
+# ill-conditioned for them
+def _fit(data, indices, ridge):
+    solution = solve_least_squares(data[indices, :-1], data[indices, -1], ridge=ridge, method="cholesky")
+    return solution.coefficients, solution.intercept
+
+
+# ("bootstrap", seed) -> coefficients per column followed by the intercept
+# ("fold", fold, folds, seed) -> (sum of squared test errors, number of test rows)
+def _run_task(data, task, ridge):
+    rows = len(data)
+    if task[0] == "bootstrap":
+        indices = np.random.default_rng(task[1]).integers(0, rows, rows)
+        coefficients, intercept = _fit(data, indices, ridge)
+        return np.append(coefficients, intercept)
+    _, fold, folds, seed = task
+    test = np.array_split(np.random.default_rng(seed).permutation(rows), folds)[fold]
+    train = np.ones(rows, dtype=bool)
+    train[test] = False
+    coefficients, intercept = _fit(data, train, ridge)
+    errors = data[test, -1] - (data[test, :-1] @ coefficients + intercept)
+    return float(errors @ errors), len(test)
+
+
+def _run_tasks(data, tasks, ridge):
+    return [_run_task(data, task, ridge) for task in tasks]
+
+
+# Worker side of the pool: the design matrix of the current pool, mapped from shared memory
+_worker_state = {}
+
+
+def _attach(name, shape):
+    memory = SharedMemory(name=name)
+    _worker_state["memory"] = memory
+    _worker_state["data"] = np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+
+
+def _run_shared_tasks(tasks, ridge):
+    return _run_tasks(_worker_state["data"], tasks, ridge)
+
+
+def _run_in_pool(data, tasks, ridge, processes):
+    memory = SharedMemory(create=True, size=max(data.nbytes, 1))
+    try:
+        shared = np.ndarray(data.shape, dtype=np.float64, buffer=memory.buf)
+        shared[:] = data
+        # A few batches per worker keep the pool busy without sending one message per refit
+        batches = [tasks[i::processes * 4] for i in range(processes * 4)]
+        with ProcessPoolExecutor(processes, initializer=_attach, initargs=(memory.name, data.shape)) as executor:
+            batch_results = list(executor.map(_run_shared_tasks, batches, [ridge] * len(batches)))
+        del shared
+    finally:
+        memory.close()
+        memory.unlink()
+    # Put the results back into task order
+    results = [None] * len(tasks)
+    for i in range(len(batches)):
+        results[i::processes * 4] = batch_results[i]
+    return results
@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# Bump when the layout of the sidecar files changes, old caches are then rebuilt
+CACHE_VERSION = 1
+DATA_SUFFIX = ".samples.npy"
+META_SUFFIX = ".samples.json"
+
+
+# Parsed sample file: parameter names from the header row and a float64 matrix (rows x columns).
+# The matrix is in Fortran order, so every column is one contiguous array. When the sidecar cache
+# could be used it is a read-only memory map and only the pages that are touched are loaded.
+class SampleStore:
+    def __init__(self, filename, header, data, cached):
+        self.filename = filename
+        self.header = header
+        self.data = data
+        # True if data is memory-mapped from the sidecar cache
+        self.cached = cached
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def column(self, name):
+        if name not in self.header:
+            raise Exception(f"Unknown parameter '{name}'")
+        return self.data[:, self.header.index(name)]
+
+    def columns(self):
+        return {name: self.data[:, i] for i, name in enumerate(self.header)}
+
+
+# Opens a sample file: lines starting with '#' are comments, the first other line holds the
+# comma-separated parameter names and every following line one sample.
+# With use_cache the parsed matrix is kept next to the file (<file>.samples.npy plus a json with the
+# size, mtime and sha256 of the source) and memory-mapped on later opens. The cache is reused while
+# size and mtime match; if only the mtime changed the source is hashed again before rebuilding.
+# If the sidecar cannot be written the samples are parsed into memory.
+def load_samples(filename, use_cache=True, chunk_rows=65536):
+    if use_cache:
+        store = _open_cached(filename)
+        if store is not None:
+            return store
+    header, rows, digest = _scan(filename)
+    if use_cache and rows > 0:
+        try:
+            return _build_cache(filename, header, rows, digest, chunk_rows)
+        except OSError:
+            pass
+    data = np.empty((rows, len(header)), dtype=np.float64, order='F')
+    _parse_into(filename, data, chunk_rows)
+    return SampleStore(filename, header, data, False)
+
+
+def invalidate_cache(filename):
+    for suffix in (DATA_SUFFIX, META_SUFFIX):
+        try:
+            os.remove(filename + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def _is_sample_line(line):
+    return line.strip() != "" and not line.startswith("#")
+
+
+def _parse_header(line):
+    return line.rstrip("\r\n").split(',')
+
+
+# First pass over the raw bytes: header, number of sample rows and sha256 of the file
+def _scan(filename):
+    digest = hashlib.sha256()
+    header = None
+    rows = 0
+    with open(filename, 'rb') as f:
+        for raw_line in f:
+            digest.update(raw_line)
+            if raw_line.strip() == b"" or raw_line.startswith(b"#"):
+                continue
+            if header is None:
+                header = _parse_header(raw_line.decode('utf-8'))
+            else:
+                rows += 1
+    if header is None:
+        raise Exception("No header row with parameter names")
+    return header, rows, digest.hexdigest()
+
+
+def _hash_file(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_header(filename):
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line in f:
+            if _is_sample_line(line):
+                return _parse_header(line)
+    raise Exception("No header row with parameter names")
+
+
+# Yields the samples of a file as matrices of at most chunk_rows rows, so the whole file never has
+# to be in memory. Rows come from the sidecar cache if it is valid, otherwise the text is parsed.
+# progress(fraction), if given, is called before every chunk with the part of the file read so far (0..1).
+def iter_sample_chunks(filename, chunk_rows=65536, use_cache=True, progress=None):
+    store = _open_cached(filename) if use_cache else None
+    if store is not None:
+        for start in range(0, len(store), chunk_rows):
+            if progress is not None:
+                progress(min(start + chunk_rows, len(store)) / len(store))
+            yield np.array(store.data[start:start + chunk_rows])
+        return
+    size = max(os.path.getsize(filename), 1)
+    with open(filename, 'r', encoding='utf-8') as f:
+        lines = (line for line in f if _is_sample_line(line))
+        header = next(lines, None)
+        if header is None:
+            raise Exception("No header row with parameter names")
+        header = _parse_header(header)
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) == chunk_rows:
+                if progress is not None:
+                    # The text layer reads ahead, so this is exact up to the size of its buffer
+                    progress(min(f.buffer.tell() / size, 1.0))
+                yield _parse_chunk(chunk, header)
+                chunk = []
+        if chunk:
+            if progress is not None:
+                progress(1.0)
+            yield _parse_chunk(chunk, header)
+
+
+def _parse_chunk(chunk, header):
+    values = np.loadtxt(chunk, delimiter=',', dtype=np.float64, ndmin=2)
+    if values.shape[1] != len(header):
+        raise Exception(f"Expected {len(header)} values per row, got {values.shape[1]}")
+    return values
+
+
+# Second pass: parses the text chunk by chunk straight into the preallocated matrix. _scan counts rows on
+# bytes and this pass reads text, which may split lines differently (a lone '\r', Unicode whitespace), so
+# the matrix must come out exactly full.
+def _parse_into(filename, data, chunk_rows):
+    row = 0
+    for values in iter_sample_chunks(filename, chunk_rows, use_cache=False):
+        if row + len(values) > len(data):
+            raise Exception(f"Expected {len(data)} rows, the file has more")
+        data[row:row + len(values)] = values
+        row += len(values)
+    if row != len(data):
+        raise Exception(f"Expected {len(data)} rows, parsed {row}")
+
+
+def _source_state(filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_meta(filename):
+    try:
+        with open(filename + META_SUFFIX, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != CACHE_VERSION:
+        return None
+    return meta
+
+
+def _write_meta(filename, meta):
+    temp_name = _temp_name(filename + META_SUFFIX)
+    try:
+        with open(temp_name, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(temp_name, filename + META_SUFFIX)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+
+# A new empty file next to target to be renamed onto it. Every writer gets its own, so several fits that
+# build the cache of one file at the same time do not truncate each other's data.
+def _temp_name(target):
+    descriptor, temp_name = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(target) + ".",
+                                             dir=os.path.dirname(os.path.abspath(target)))
+    os.close(descriptor)
+    return temp_name
+
+
+def _open_cached(filename):
+    meta = _read_meta(filename)
+    if meta is None or not os.path.exists(filename + DATA_SUFFIX):
+        return None
+    size, mtime = _source_state(filename)
+    if size != meta["size"]:
+        return None
+    if mtime != meta["mtime_ns"]:
+        # Touched but possibly not changed (copied, checked out again): compare contents
+        if _hash_file(filename) != meta["sha256"]:
+            return None
+        meta["mtime_ns"] = mtime
+        try:
+            _write_meta(filename, meta)
+        except OSError:
+            pass
+    try:
+        data = np.load(filename + DATA_SUFFIX, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if data.shape != (meta["rows"], len(meta["header"])):
+        return None
+    return SampleStore(filename, meta["header"], data, True)
+
+
+def _build_cache(filename, header, rows, digest, chunk_rows):
+    size, mtime = _source_state(filename)
+    temp_name = _temp_name(filename + DATA_SUFFIX)
+    try:
+        data = np.lib.format.open_memmap(temp_name, mode='w+', dtype=np.float64, shape=(rows, len(header)),
+                                         fortran_order=True)
+        try:
+            _parse_into(filename, data, chunk_rows)
+            data.flush()
+        finally:
+            del data
+        os.replace(temp_name, filename + DATA_SUFFIX)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    _write_meta(filename, {"version": CACHE_VERSION, "size": size, "mtime_ns": mtime, "sha256": digest,
+                            "rows": rows, "header": header})
+    return SampleStore(filename, header, np.load(filename + DATA_SUFFIX, mmap_mode='r'), True)
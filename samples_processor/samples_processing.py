@@ -1,76 +1,133 @@
-from sklearn import linear_model
-import matplotlib.pyplot as plt
+import numpy as np
 
 from expression_processor.evaluator_wrapper import EvaluatorWrapper
-from expression_processor.tokenizer import Token, TokenType, Tokenizer
-
-
-def open_samples(filename):
-    with open(filename, 'r', encoding='utf-8') as f:
-        text = f.readlines()
-        lines = []
-        # Ignore lines starting with #
-        for line in text:
-            if line[0] != '#':
-                lines.append(line)
-        params_order = lines[0].replace('\n', '').split(',')
-        lines.pop(0)
-        samples = []
-        for line in lines:
-            line = [float(x) for x in line.split(',')]
-            samples.append(line)
-        return [params_order, samples]
+from samples_processor.fit_report import draw_fit_plot, write_report
+from samples_processor.formula_processing import Main
+from samples_processor.least_squares import solve_least_squares
+from samples_processor.sample_store import load_samples, read_header, iter_sample_chunks
+from samples_processor.streaming_regression import StreamingLeastSquares
+from expression_processor.tokenizer import Token, TokenType, print_parts
+
+
+# [parameter names, samples matrix (rows x columns)]; the matrix is memory-mapped from the
+# sidecar cache written by sample_store when possible
+def open_samples(filename, use_cache=True):
+    store = load_samples(filename, use_cache)
+    return [store.header, store.data]
 
 
 def make_plot(predicted_values, observed_values):
+    # pyplot takes most of a second to import and is only needed for the interactive window
+    import matplotlib.pyplot as plt
+
     # Создание графика
     plt.figure(figsize=(10, 6))  # Размер графика
-    plt.scatter(predicted_values, observed_values, color='blue', label='Observed vs Predicted')
-
-    # Добавление линии y=x для наглядности
-    max_val = max(max(predicted_values), max(observed_values))
-    plt.plot([0, max_val], [0, max_val], color='red', linestyle='--', label='y=x')
-
-    # Настройка заголовка и подписей осей
-    plt.title('Предсказанные и наблюдаемые значения')
-    plt.xlabel('Предсказанное значение')
-    plt.ylabel('Наблюдаемое значение')
-    plt.legend()
-    plt.grid(True)
+    draw_fit_plot(plt.gca(), predicted_values, observed_values)
 
     # Отображение графика
     plt.show()
 
 
-def substitute_param(param, param_value, param_expression, ew):
-    ew.define("AAA", "1")
-    ew.define(param, param_value)
-    param_expression.append(Token(TokenType.EOF, "", None))
-    new_param_value = ew.eval_tokens(param_expression)
-    return new_param_value
+# Tokens of one term of the formula with its coefficient replaced by 1, so that the term
+# evaluates to the transformed value of the parameter
+def make_term_tokens(part, coefficient_name):
+    tokens = []
+    for token in part:
+        if token.type == TokenType.IDENTIFIER and token.lexeme == coefficient_name:
+            tokens.append(Token(TokenType.NUMBER, "1", 1.0))
+        else:
+            tokens.append(token)
+    tokens.append(Token(TokenType.EOF, "", None))
+    return tokens
 
-def fun_mnk(filename, expression):
-    return_value = []
-    ew = EvaluatorWrapper()
-    try:
-        samples_obj = open_samples(filename)
-    except Exception as e:
-        raise Exception(f"Неверный формат файла ({type(e).__name__}: {str(e)})")
-    params_order = samples_obj[0][:-1]
-    y_param_name = samples_obj[0][-1]
-
-    samples = samples_obj[1]
-    x_list = []
-    y_list = []
-    y_calculated_list = []
-    for s in samples:
-        x_list.append(s[:-1])
-        y_list.append(s[-1])
-    res = Main().process_mnk(expression)
-    if res is None:
-        print("None")
-    else:
-        print_parts(res)
+
+# Applies the term of every parameter to its whole column at once. Terms read the original
+# columns, parameters without a term are left as they are.
+def transform_samples(x_list, params_order, actions_list, ew):
+    original = np.asarray(x_list, dtype=np.float64).reshape(len(x_list), len(params_order))
+    columns = {params_order[i]: original[:, i] for i in range(len(params_order))}
+    transformed = original.copy()
+    # The last term of a parameter wins
+    terms = {given_param: term_tokens for given_param, term_tokens in actions_list}
+    indices = [i for i in range(len(params_order)) if params_order[i] in terms]
+    values = ew.eval_all_tokens_vectorized([terms[params_order[i]] for i in indices], columns)
+    for i, value in zip(indices, values):
+        transformed[:, i] = value
+    return transformed
+
+
+# Predictions of a model on some samples; residuals, R² and RMSE are None when observed values are unknown
+class ModelEvaluation:
+    def __init__(self, predictions, observed=None):
+        self.predictions = predictions
+        self.observed = observed
+        self.residuals = None
+        self.r2 = None
+        self.rmse = None
+        if observed is not None:
+            self.residuals = observed - predictions
+            ss_res = float(self.residuals @ self.residuals)
+            deviations = observed - observed.mean()
+            ss_tot = float(deviations @ deviations)
+            self.r2 = 1 - ss_res / ss_tot if ss_tot != 0 else float("nan")
+            self.rmse = float(np.sqrt(ss_res / len(observed)))
+
+    # Metrics only, for fits that never hold all samples in memory
+    @staticmethod
+    def from_sums(rows, ss_res, ss_tot):
+        evaluation = ModelEvaluation(None)
+        evaluation.r2 = 1 - ss_res / ss_tot if ss_tot != 0 else float("nan")
+        evaluation.rmse = float(np.sqrt(ss_res / rows))
+        return evaluation
+
+
+# Linear model over transformed parameters: y = intercept + sum(coefficients[i] * term_i(x)),
+# where term_i is the term of parameter params_order[i] with its coefficient replaced by 1
+class FittedModel:
+    def __init__(self, params_order, y_param_name, actions_list, coefficients, intercept, ew=None):
+        self.params_order = params_order
+        self.y_param_name = y_param_name
+        self.actions_list = actions_list
+        self.coefficients = np.asarray(coefficients, dtype=np.float64)
+        self.intercept = float(intercept)
+        self.ew = ew if ew is not None else EvaluatorWrapper()
+        # Coefficients in the order of the original formula (a0, a1, ...) followed by the intercept
+        self.formula_coefficients = []
+        # Result of evaluate() on the samples the model was fitted on
+        self.evaluation = None
+
+    # Raw parameter values (rows in params_order) -> design matrix
+    def transform(self, x_list):
+        return transform_samples(x_list, self.params_order, self.actions_list, self.ew)
+
+    def predict(self, design_matrix):
+        return np.asarray(design_matrix, dtype=np.float64) @ self.coefficients + self.intercept
+
+    def evaluate(self, design_matrix, observed=None):
+        if observed is not None:
+            observed = np.asarray(observed, dtype=np.float64)
+        return ModelEvaluation(self.predict(design_matrix), observed)
+
+    # Applies the model to another sample file without refitting. Columns are matched by name,
+    # the observed column is optional.
+    def apply_to_file(self, filename):
+        try:
+            header, samples = open_samples(filename)
+        except Exception as e:
+            raise Exception(f"Неверный формат файла ({type(e).__name__}: {str(e)})")
+        missing = [param for param in self.params_order if param not in header]
+        if missing:
+            raise Exception(f"В файле нет параметров: {', '.join(missing)}")
+        x_list = samples[:, [header.index(param) for param in self.params_order]]
+        observed = None
+        if self.y_param_name in header:
+            observed = samples[:, header.index(self.y_param_name)]
+        return self.evaluate(self.transform(x_list), observed)
+
+
+# Matches the terms of an MNK formula (parts from Main.check_for_MNK_formula) with the parameters of the samples.
+# Returns actions_list ([parameter, term tokens]) and swap_order ([index of the term, index of the parameter]).
+def match_terms(params_order, res):
     # i - place in calculated params
     # j - place in used params
     # if i == j for i in range(len(coefs)) - OK
@@ -78,45 +135,103 @@ def fun_mnk(filename, expression):
     # Определяем как поменять местами параметры и определяем какие-действия нужно выполнить с каждым из параметров
     actions_list = []
     swap_order = []
+    # Identifier -> indices of the parts it occurs in, once per occurrence
+    occurrences = {}
+    for given_param_index in range(len(res)):
+        for token in res[given_param_index]:
+            occurrences.setdefault(token.lexeme, []).append(given_param_index)
     for calculated_param_index in range(len(params_order)):
         calculated_param = params_order[calculated_param_index]
-        for given_param_index in range(len(res)):
-            for token in res[given_param_index]:
-                given_param = token.lexeme
-                if given_param == calculated_param:
-                    swap_order.append([given_param_index, calculated_param_index])
-                    print(
-                        f"Given param {given_param} is at {given_param_index}, while calculated {calculated_param} is at {calculated_param_index}, so a[{swap_order[-1][0]}] = {params_order[swap_order[-1][1]]}")
-                    action = res[given_param_index]
-                    for token in action:
-                        if token.lexeme == "a" + str(given_param_index):
-                            token.lexeme = "AAA"
-                    actions_list.append([given_param, action])
-    # Высчитавыаем "новую" выборку
-    for calculated_param_index in range(len(x_list)):
-        for i in range(len(params_order)):
-            param = params_order[i]
-            param_value = x_list[calculated_param_index][i]
-            for i in range(len(actions_list)):
-                if param == actions_list[i][0]:
-                    param_expression = actions_list[i][1]
-                    new_value = float(substitute_param(param, param_value, param_expression, ew))
-                    x_list[calculated_param_index][i] = new_value
-    # Линейная регрессия
-    clf = linear_model.LinearRegression()
-    clf.fit(x_list, y_list)
-    coefs = clf.coef_
-    print("a0, a1, a2 ...:", coefs)
+        for given_param_index in occurrences.get(calculated_param, []):
+            swap_order.append([given_param_index, calculated_param_index])
+            action = make_term_tokens(res[given_param_index], "a" + str(given_param_index))
+            actions_list.append([calculated_param, action])
+    return actions_list, swap_order
+
+
+# Coefficients fitted per parameter -> coefficients in the order of the formula (a0, a1, ...) followed by
+# the intercept, and the parameter of each formula coefficient
+def order_coefficients(params_order, swap_order, coefs, intercept):
+    return_value = []
     # Меняем порядок когда уже знаем точные значения параметров; запоминаем порядок изначального выражения
     original_formula_params_order = []
     for i in range(len(params_order)):
         original_formula_params_order.append(0)
         return_value.append(0)
     for swap in swap_order:
-        ew.define("a" + str(swap[0]), coefs[swap[1]])
         original_formula_params_order[swap[0]] = params_order[swap[1]]
         return_value[swap[0]] = coefs[swap[1]]
-    return_value.append(clf.intercept_)
+    return_value.append(intercept)
+    return return_value, original_formula_params_order
+
+
+# With streaming the samples are read chunk_rows rows at a time and fitted by StreamingLeastSquares,
+# so memory does not grow with the size of the file; model.evaluation then has no per-row values.
+# ridge > 0 penalises the coefficients (not the intercept), method is passed to solve_least_squares.
+def fit_mnk(filename, expression, streaming=False, chunk_rows=65536, ridge=0.0, method="auto", progress=None):
+    # progress(percent) is called between the stages of the fit, and when streaming after every chunk with the
+    # part of the file read so far; an exception raised by it aborts the fit
+    if progress is None:
+        progress = _no_progress
+    ew = EvaluatorWrapper()
+    try:
+        if streaming:
+            header = read_header(filename)
+        else:
+            header, samples = open_samples(filename)
+    except Exception as e:
+        raise Exception(f"Неверный формат файла ({type(e).__name__}: {str(e)})")
+    progress(10)
+    params_order = header[:-1]
+    y_param_name = header[-1]
+
+    res = Main().process_mnk(expression)
+    if res is None:
+        print("None")
+    else:
+        print_parts(res)
+    actions_list, swap_order = match_terms(params_order, res)
+    for given_param_index, calculated_param_index in swap_order:
+        print(f"Given param {params_order[calculated_param_index]} is at {given_param_index}, while calculated "
+              f"{params_order[calculated_param_index]} is at {calculated_param_index}, so a[{given_param_index}] = "
+              f"{params_order[calculated_param_index]}")
+    if streaming:
+        # Выборка преобразуется и учитывается по частям
+        solver = StreamingLeastSquares(len(params_order))
+        read = [0.0]
+
+        def record_read(fraction):
+            read[0] = fraction
+
+        chunks = iter_sample_chunks(filename, chunk_rows, progress=record_read)
+        while True:
+            try:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                solver.add(transform_samples(chunk[:, :-1], params_order, actions_list, ew), chunk[:, -1])
+            except Exception as e:
+                raise Exception(f"Неверный формат файла ({type(e).__name__}: {str(e)})")
+            # Outside the try, so an abort requested by progress is not reported as a format error
+            progress(10 + 70 * read[0])
+        coefs, intercept = solver.solve(ridge)
+        condition = solver.condition
+    else:
+        # Высчитавыаем "новую" выборку
+        x_list = transform_samples(samples[:, :-1], params_order, actions_list, ew)
+        y_list = samples[:, -1]
+        progress(40)
+        # Линейная регрессия
+        solution = solve_least_squares(x_list, y_list, ridge=ridge, method=method)
+        coefs = solution.coefficients
+        intercept = solution.intercept
+        condition = solution.condition
+    progress(80)
+    if condition > 1e10:
+        print(f"Warning: ill-conditioned design matrix (condition number {condition:.3g}), "
+              f"coefficients may be inaccurate; consider ridge > 0")
+    print("a0, a1, a2 ...:", coefs)
+    return_value, original_formula_params_order = order_coefficients(params_order, swap_order, coefs, intercept)
 
     # Формула с учетом "вычисленной выборки"
     formula = f"{y_param_name} = "
@@ -125,96 +240,43 @@ def fun_mnk(filename, expression):
         if i != len(params_order) - 1:
             formula += " + "
     print("FORMULA: ", formula)
-    # Подставляем значения
-    for calculated_param_index in range(len(x_list)):
-        for i in range(len(params_order)):
-            param = params_order[i]
-            param_value = x_list[calculated_param_index][i]
-            ew.define(param, param_value)
-        answer = float(ew.eval(formula))
-        y_calculated_list.append(answer)
-    print(f"Predicted:{y_calculated_list[0]}, Observed:{y_list[0]}")
-    print("x_list:", x_list)
-    print("y_calculated_list:", y_calculated_list)
-
-    y_calculated_list = [y + clf.intercept_ for y in y_calculated_list]
-    make_plot(y_calculated_list, y_list)
-    return return_value
-
-class Main:
-    ew = EvaluatorWrapper()
 
-    def print_formulas(formulas):
-        for i in range(len(formulas)):
-            print(f"F{i}: '{formulas[i]}'")
-        return 0
+    model = FittedModel(params_order, y_param_name, actions_list, coefs, intercept, ew)
+    model.formula_coefficients = return_value
+    if streaming:
+        model.evaluation = ModelEvaluation.from_sums(solver.rows, solver.residual_sum_of_squares(),
+                                                     solver.total_sum_of_squares())
+    else:
+        # Предсказанные значения, остатки и метрики за один проход
+        model.evaluation = model.evaluate(x_list, y_list)
+        print(f"Predicted:{model.evaluation.predictions[0]}, Observed:{y_list[0]}")
+    print(f"R2: {model.evaluation.r2}, RMSE: {model.evaluation.rmse}")
+    progress(100)
+    return model
+
 
-    def process_formula(self, formula):
-        answer = None
-        try:
-            answer = self.ew.eval(formula)
-        except Exception as e:
-            print("process_formula exception:" + str(e))
-        return answer
+def _no_progress(percent):
+    pass
 
-    def print_tokens(self, tokens):
-        i = 0
-        for t in tokens:
-            print(str(i) + ". " + str(t))
-            i += 1
 
-    def process_mnk(self, formula):
-        result = None
-        try:
-            sc = Tokenizer(formula)
-            tokens = sc.parse_tokens()
-            # self.print_tokens(tokens)
-            result = self.check_for_MNK_formula(tokens)
-        except Exception as e:
-            raise Exception("process_MNK exception: " + str(e))
-        return result
-
-    # Примем, что выражение должно содержать параметры, имеющие название a1, a2, a3, ... и т.д. и никак иначе
-    # Нужны коэффициенты при параметрах a1, a2, a3 и свободный коэффициент
-    def check_for_MNK_formula(self, tokens):
-        count_assign = 0
-        params_count = 0
-        for t in tokens:
-            if t.type == TokenType.ASSIGN:
-                count_assign += 1
-        # Ensure that formula looks like this:
-        # y = ...
-        if not ((tokens[0].type == TokenType.IDENTIFIER) and (tokens[1].type == TokenType.ASSIGN) and (
-                count_assign == 1)):
-            print("Errcode 1")
-            return None
-        parts = []
-        p = []
-        for i in range(2, len(tokens)):
-            t = tokens[i]
-            # print(t.__str__())
-
-            if i == 2 or (t.type != TokenType.PLUS and t.type != TokenType.MINUS):
-                p.append(t)
-            else:
-                parts.append(p)
-                p = []
-                if t.type == TokenType.MINUS:
-                    p.append(t)
-        parts.append(p)
-        parts[-1] = parts[-1][:-1]  # Удаляем EOF
-        # Check parts
-        for i in range(len(parts)):
-            # Первый токен должен быть идентификатором с именем a0, далее a1, a2 и т.д.
-            if parts[i][0].type == TokenType.IDENTIFIER:
-                first_identificator = parts[i][0]
-            else:
-                first_identificator = parts[i][1]
-            if first_identificator.type != TokenType.IDENTIFIER:
-                raise Exception("Первый токен должен быть идентификатором")
-                return None
-            if int(first_identificator.lexeme[1]) != i:
-                raise Exception("Значения параметров должны соответствовать шаблону a0, a1, a2 и так далее")
-                # print("Значения параметров должны соответствовать шаблону a0, a1, a2 и так далее")
-                return None
-        return parts
\ No newline at end of file
+# Fits the formula and returns formula_coefficients. plot shows the interactive plot; report is a file name
+# prefix for the PNG/SVG/HTML report, written in the background when a ReportWriter is given as writer.
+def fun_mnk(filename, expression, plot=True, report=None, writer=None):
+    model = fit_mnk(filename, expression)
+    if report is not None:
+        coefficients = report_coefficients(model.formula_coefficients[:-1], model.formula_coefficients[-1])
+        if writer is not None:
+            writer.submit(report, model.evaluation, coefficients, expression)
+        else:
+            write_report(report, model.evaluation, coefficients, expression)
+    if plot:
+        make_plot(model.evaluation.predictions, model.evaluation.observed)
+    return model.formula_coefficients
+
+
+# Coefficient names and values for the reports: a0, a1, ... and the intercept if there is one
+def report_coefficients(coefficients, intercept=None):
+    names = {f"a{i}": float(coefficients[i]) for i in range(len(coefficients))}
+    if intercept is not None:
+        names["Свободный член"] = float(intercept)
+    return names
@@ -0,0 +1,402 @@
+import math
+import time
+
+import numpy as np
+from scipy.linalg import solve_triangular
+
+from samples_processor.candidate_fitting import term_columns
+from samples_processor.samples_processing import open_samples
+
+
+# Candidate terms built from the parameters: every parameter, its powers, square root and reciprocal,
+# and the pairwise products and ratios
+def build_term_library(params, powers=(2, 3), roots=True, reciprocals=True, products=True, ratios=True):
+    terms = []
+    for param in params:
+        terms.append(param)
+        for power in powers:
+            terms.append(f"{param}^{power}")
+        if roots:
+            terms.append(f"sqrt({param})")
+        if reciprocals:
+            terms.append(f"1/{param}")
+    for i in range(len(params)):
+        for j in range(i + 1, len(params)):
+            if products:
+                terms.append(f"{params[i]}*{params[j]}")
+            if ratios:
+                terms.append(f"{params[i]}/{params[j]}")
+                terms.append(f"{params[j]}/{params[i]}")
+    return terms
+
+
+# Cholesky factor R (R'R = C[S, S]) of the centered Gram matrix C restricted to the selected columns S,
+# together with z = R'^-1 C[S, y]. The residual sum of squares of the fit on S is C[y, y] - |z|^2.
+# Adding a column appends one row and column to R; removing one is repaired with Givens rotations,
+# so neither needs a refactorization.
+class IncrementalCholesky:
+    def __init__(self, gram):
+        self.gram = gram
+        self.y = gram.shape[0] - 1
+        self.selected = []
+        self.r = np.zeros((0, 0))
+        self.z = np.zeros(0)
+
+    def rss(self):
+        return float(self.gram[self.y, self.y] - self.z @ self.z)
+
+    def coefficients(self):
+        if not self.selected:
+            return np.zeros(0)
+        return solve_triangular(self.r, self.z)
+
+    # New column of R, its diagonal element and the new element of z for column j (None if collinear)
+    def __extension(self, j):
+        gram = self.gram
+        w = solve_triangular(self.r, gram[self.selected, j], trans='T') if self.selected else np.zeros(0)
+        d2 = gram[j, j] - w @ w
+        if d2 <= 1e-12 * gram[j, j] or d2 <= 0:
+            return None
+        d = math.sqrt(d2)
+        return w, d, (gram[j, self.y] - w @ self.z) / d
+
+    # Residual sum of squares after adding each of the columns, inf for collinear ones
+    def trial_add_rss(self, columns):
+        columns = np.asarray(columns)
+        gram = self.gram
+        if self.selected:
+            w = solve_triangular(self.r, gram[np.ix_(self.selected, columns)], trans='T')
+            d2 = gram[columns, columns] - (w * w).sum(axis=0)
+            numerator = gram[columns, self.y] - w.T @ self.z
+        else:
+            d2 = gram[columns, columns].copy()
+            numerator = gram[columns, self.y]
+        valid = d2 > 1e-12 * gram[columns, columns]
+        rss = np.full(len(columns), np.inf)
+        rss[valid] = self.rss() - numerator[valid] ** 2 / d2[valid]
+        return rss
+
+    # Residual sum of squares after removing each selected column
+    def trial_remove_rss(self):
+        beta = self.coefficients()
+        inverse = solve_triangular(self.r, np.eye(len(self.selected)))
+        return self.rss() + beta ** 2 / (inverse * inverse).sum(axis=1)
+
+    def add(self, j):
+        extension = self.__extension(j)
+        if extension is None:
+            return False
+        w, d, zj = extension
+        k = len(self.selected)
+        r = np.zeros((k + 1, k + 1))
+        r[:k, :k] = self.r
+        r[:k, k] = w
+        r[k, k] = d
+        self.r = r
+        self.z = np.append(self.z, zj)
+        self.selected.append(j)
+        return True
+
+    # Coefficients (in selected order, then j) of the fit with column j added, without changing the factor
+    def trial_add_coefficients(self, j):
+        extension = self.__extension(j)
+        if extension is None:
+            return None
+        w, d, zj = extension
+        k = len(self.selected)
+        r = np.zeros((k + 1, k + 1))
+        r[:k, :k] = self.r
+        r[:k, k] = w
+        r[k, k] = d
+        return solve_triangular(r, np.append(self.z, zj))
+
+    def remove(self, position):
+        self.r, self.z = self.__removed(position)
+        del self.selected[position]
+
+    def trial_remove_coefficients(self, position):
+        r, z = self.__removed(position)
+        return solve_triangular(r, z) if len(z) else np.zeros(0)
+
+    def __removed(self, position):
+        k = len(self.selected)
+        augmented = np.hstack([np.delete(self.r, position, axis=1), self.z[:, None]])
+        # Columns after the removed one are now one row too low: rotate rows i, i + 1 to clear the subdiagonal
+        for i in range(position, k - 1):
+            a = augmented[i, i]
+            b = augmented[i + 1, i]
+            norm = math.hypot(a, b)
+            if norm == 0:
+                continue
+            c = a / norm
+            s = b / norm
+            upper = augmented[i].copy()
+            augmented[i] = c * upper + s * augmented[i + 1]
+            augmented[i + 1] = -s * upper + c * augmented[i + 1]
+        return augmented[:k - 1, :k - 1], augmented[:k - 1, -1]
+
+
+class StepwiseResult:
+    def __init__(self, y_param_name, terms, coefficients, intercept, criterion, score, history, timed_out):
+        self.y_param_name = y_param_name
+        self.terms = terms
+        self.coefficients = coefficients
+        self.intercept = intercept
+        self.criterion = criterion
+        self.score = score
+        # (action, term, score) for every accepted step
+        self.history = history
+        self.timed_out = timed_out
+
+    # The selected structure as a formula for fit_mnk_nonlinear
+    def formula(self):
+        parts = [f"a{i} * ({self.terms[i]})" for i in range(len(self.terms))]
+        parts.append(f"a{len(self.terms)}")
+        return f"{self.y_param_name} = " + " + ".join(parts)
+
+    def __str__(self):
+        lines = [f"{self.criterion.upper()} {self.score:.6g}" + (" (time budget reached)" if self.timed_out else "")]
+        for term, coefficient in zip(self.terms, self.coefficients):
+            lines.append(f"{coefficient:.6g} * {term}")
+        lines.append(f"{self.intercept:.6g}")
+        return "\n".join(lines)
+
+
+# Forward/backward stepwise search over a library of candidate terms (build_term_library by default).
+# Every step adds the term that improves the criterion most or removes one if that is better, until no
+# move improves it, max_terms is reached or time_budget seconds have passed.
+# criterion is "aic", "bic" or "cv" (k-fold cross-validated mean squared error). All library columns are
+# evaluated once and reduced to centered Gram matrices (one per training fold for "cv"); the steps only
+# update Cholesky factors of those.
+def stepwise_mnk(filename, library=None, criterion="bic", max_terms=None, time_budget=None, folds=5, seed=None,
+                 chunk_rows=65536):
+    started = time.monotonic()
+    if criterion not in ("aic", "bic", "cv"):
+        raise Exception(f"Unknown criterion '{criterion}'")
+    try:
+        header, samples = open_samples(filename)
+    except Exception as e:
+        raise Exception(f"Неверный формат файла ({type(e).__name__}: {str(e)})")
+    rows = len(samples)
+    if rows < 2:
+        raise Exception("No samples to fit")
+    if library is None:
+        library = build_term_library(header[:-1])
+    library = _evaluable_terms(samples, header, library)
+
+    fold_of_row = None
+    if criterion == "cv":
+        fold_of_row = np.empty(rows, dtype=np.int64)
+        fold_of_row[np.random.default_rng(seed).permutation(rows)] = np.arange(rows) % folds
+    probe = term_columns(samples[:min(rows, 1024)], header, library)
+    finite = np.isfinite(probe)
+    shift = np.where(finite, probe, 0).sum(axis=0) / np.maximum(finite.sum(axis=0), 1)
+    totals, fold_sums, usable = _gram(samples, header, library, shift, fold_of_row, folds, chunk_rows)
+    # Terms that are not finite on every row or are constant are dropped with their rows and columns
+    keep = np.flatnonzero(usable)
+    library = [library[j] for j in keep[:-1]]
+    shift = shift[keep]
+    totals = _columns(totals, keep)
+    fold_sums = [_columns((fold_sum, fold_gram), keep) + (fold_rows,) for fold_sum, fold_gram, fold_rows in fold_sums]
+    if max_terms is None:
+        max_terms = min(len(library), rows - 2)
+    sums, gram = totals
+    centered = gram - np.outer(sums, sums) / rows
+    means = shift + sums / rows
+
+    if criterion == "cv":
+        search = _CrossValidationSearch(totals, fold_sums, rows)
+    else:
+        search = _InformationSearch(centered, rows, criterion)
+    score = search.score()
+    history = []
+    visited = {frozenset()}
+    timed_out = False
+    while True:
+        if time_budget is not None and time.monotonic() - started > time_budget:
+            timed_out = True
+            break
+        selected = search.selected()
+        moves = []
+        if len(selected) < max_terms:
+            candidates = [j for j in range(len(library)) if j not in selected and
+                          frozenset(selected + [j]) not in visited]
+            if candidates:
+                scores = search.trial_add(candidates)
+                best = int(np.argmin(scores))
+                moves.append((scores[best], "add", candidates[best]))
+        if selected:
+            scores = search.trial_remove()
+            for position in np.argsort(scores):
+                if frozenset(selected[:position] + selected[position + 1:]) not in visited:
+                    moves.append((scores[position], "remove", int(position)))
+                    break
+        if not moves:
+            break
+        new_score, action, index = min(moves, key=lambda move: move[0])
+        if not new_score < score - 1e-9 * abs(score):
+            break
+        if action == "add":
+            search.add(index)
+            history.append(("add", library[index], float(new_score)))
+        else:
+            history.append(("remove", library[selected[index]], float(new_score)))
+            search.remove(index)
+        score = search.score()
+        visited.add(frozenset(search.selected()))
+
+    final = IncrementalCholesky(centered)
+    for j in search.selected():
+        final.add(j)
+    coefficients = final.coefficients()
+    intercept = float(means[-1] - means[final.selected] @ coefficients)
+    return StepwiseResult(header[-1], [library[j] for j in final.selected], list(coefficients), intercept, criterion,
+                          float(score), history, timed_out)
+
+
+# Terms that can be evaluated on the samples at all; whether their values are usable is decided by _gram
+def _evaluable_terms(samples, header, library):
+    probe = samples[:min(len(samples), 16)]
+    evaluable = []
+    for term in library:
+        try:
+            term_columns(probe, header, [term])
+        except Exception:
+            continue
+        evaluable.append(term)
+    return evaluable
+
+
+# (sums, Gram) of all shifted rows, the same of the rows of every fold if fold_of_row is given, and a mask of
+# the columns that are finite on all rows and not constant. Non-finite values are summed as zeros, so they
+# do not spoil the other columns.
+def _gram(samples, header, library, shift, fold_of_row, folds, chunk_rows):
+    width = len(library) + 1
+    sums = np.zeros(width)
+    gram = np.zeros((width, width))
+    fold_sums = [(np.zeros(width), np.zeros((width, width)), 0) for _ in range(folds)] if fold_of_row is not None \
+        else []
+    finite = np.ones(width, dtype=bool)
+    low = np.full(width, np.inf)
+    high = np.full(width, -np.inf)
+    for start in range(0, len(samples), chunk_rows):
+        # Non-finite values are expected here and handled below
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            block = term_columns(samples[start:start + chunk_rows], header, library) - shift
+        block_finite = np.isfinite(block)
+        if not block_finite.all():
+            finite &= block_finite.all(axis=0)
+            block[~block_finite] = 0
+        low = np.minimum(low, block.min(axis=0))
+        high = np.maximum(high, block.max(axis=0))
+        sums += block.sum(axis=0)
+        gram += block.T @ block
+        for fold in range(len(fold_sums)):
+            part = block[fold_of_row[start:start + chunk_rows] == fold]
+            fold_sum, fold_gram, fold_rows = fold_sums[fold]
+            fold_sums[fold] = (fold_sum + part.sum(axis=0), fold_gram + part.T @ part, fold_rows + len(part))
+    if not finite[-1]:
+        raise Exception("Значения y содержат нечисловые элементы")
+    usable = finite & (high > low)
+    usable[-1] = True
+    return (sums, gram), fold_sums, usable
+
+
+# (sums, Gram) restricted to the given columns
+def _columns(totals, keep):
+    sums, gram = totals
+    return sums[keep], gram[np.ix_(keep, keep)]
+
+
+class _InformationSearch:
+    def __init__(self, centered, rows, criterion):
+        self.__factor = IncrementalCholesky(centered)
+        self.__rows = rows
+        self.__penalty = 2 if criterion == "aic" else math.log(rows)
+
+    def __score(self, rss, terms):
+        rows = self.__rows
+        return rows * math.log(max(rss, 1e-300) / rows) + self.__penalty * (terms + 1)
+
+    def selected(self):
+        return list(self.__factor.selected)
+
+    def score(self):
+        return self.__score(self.__factor.rss(), len(self.__factor.selected))
+
+    def trial_add(self, candidates):
+        terms = len(self.__factor.selected) + 1
+        return np.array([self.__score(rss, terms) if np.isfinite(rss) else np.inf
+                         for rss in self.__factor.trial_add_rss(candidates)])
+
+    def trial_remove(self):
+        terms = len(self.__factor.selected) - 1
+        return np.array([self.__score(rss, terms) for rss in self.__factor.trial_remove_rss()])
+
+    def add(self, j):
+        self.__factor.add(j)
+
+    def remove(self, position):
+        self.__factor.remove(position)
+
+
+# Cross-validated mean squared error: one factor per training fold, and the Gram matrix of every test fold
+# centered at the means of its training rows, so test errors come from the coefficients alone
+class _CrossValidationSearch:
+    def __init__(self, totals, fold_sums, rows):
+        sums, gram = totals
+        self.__rows = rows
+        self.__factors = []
+        self.__tests = []
+        for fold_sum, fold_gram, fold_rows in fold_sums:
+            train_rows = rows - fold_rows
+            train_sum = sums - fold_sum
+            train_centered = (gram - fold_gram) - np.outer(train_sum, train_sum) / train_rows
+            offset = train_sum / train_rows
+            test = fold_gram - np.outer(fold_sum, offset) - np.outer(offset, fold_sum) + \
+                fold_rows * np.outer(offset, offset)
+            self.__factors.append(IncrementalCholesky(train_centered))
+            self.__tests.append(test)
+
+    def __test_error(self, test, columns, beta):
+        y = test.shape[0] - 1
+        columns = list(columns)
+        return test[y, y] - 2 * beta @ test[columns, y] + beta @ test[np.ix_(columns, columns)] @ beta
+
+    def selected(self):
+        return list(self.__factors[0].selected)
+
+    def score(self):
+        return sum(self.__test_error(test, factor.selected, factor.coefficients())
+                   for factor, test in zip(self.__factors, self.__tests)) / self.__rows
+
+    def trial_add(self, candidates):
+        scores = []
+        for j in candidates:
+            error = 0.0
+            for factor, test in zip(self.__factors, self.__tests):
+                beta = factor.trial_add_coefficients(j)
+                if beta is None:
+                    error = np.inf
+                    break
+                error += self.__test_error(test, factor.selected + [j], beta)
+            scores.append(error / self.__rows)
+        return np.array(scores)
+
+    def trial_remove(self):
+        scores = []
+        for position in range(len(self.selected())):
+            error = 0.0
+            for factor, test in zip(self.__factors, self.__tests):
+                columns = factor.selected[:position] + factor.selected[position + 1:]
+                error += self.__test_error(test, columns, factor.trial_remove_coefficients(position))
+            scores.append(error / self.__rows)
+        return np.array(scores)
+
+    def add(self, j):
+        for factor in self.__factors:
+            factor.add(j)
+
+    def remove(self, position):
+        for factor in self.__factors:
+            factor.remove(position)
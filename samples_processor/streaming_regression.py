@@ -0,0 +1,107 @@
+import numpy as np
+from scipy.linalg import lapack, solve_triangular
+
+
+# Least squares over samples that arrive in chunks. Only the R factor of the QR decomposition of
+# [X 1 y] is kept, so memory depends on the number of features and the chunk size, not on the number
+# of rows. X and y are shifted by the means of the first chunk, which keeps the intercept column
+# from degrading the conditioning the way raw offsets would.
+class StreamingLeastSquares:
+    def __init__(self, n_features, fit_intercept=True):
+        self.n_features = n_features
+        self.fit_intercept = fit_intercept
+        self.rows = 0
+        self.__width = n_features + (1 if fit_intercept else 0)
+        self.__r = np.zeros((0, self.__width + 1))
+        self.__x_shift = np.zeros(n_features)
+        self.__y_shift = 0.0
+        # Sums of the shifted observed values, for the total sum of squares
+        self.__y_sum = 0.0
+        self.__y_square_sum = 0.0
+        self.__solution = None
+        # Of the last solve(): condition number estimate of the triangular factor and numerical rank
+        self.condition = None
+        self.rank = None
+
+    def add(self, x, y):
+        y = np.asarray(y, dtype=np.float64).ravel()
+        x = np.asarray(x, dtype=np.float64).reshape(len(y), self.n_features)
+        if len(y) == 0:
+            return self
+        if self.rows == 0 and self.fit_intercept:
+            self.__x_shift = x.mean(axis=0)
+            self.__y_shift = float(y.mean())
+        shifted_y = y - self.__y_shift
+        columns = [x - self.__x_shift]
+        if self.fit_intercept:
+            columns.append(np.ones((len(y), 1)))
+        columns.append(shifted_y[:, None])
+        block = np.hstack(columns)
+        self.__r = np.linalg.qr(np.vstack([self.__r, block]), mode='r')
+        self.__y_sum += float(shifted_y.sum())
+        self.__y_square_sum += float(shifted_y @ shifted_y)
+        self.rows += len(y)
+        self.__solution = None
+        return self
+
+    def add_all(self, chunks):
+        for x, y in chunks:
+            self.add(x, y)
+        return self
+
+    # R padded to (width + 1) rows while fewer rows than columns have been seen
+    def __square_r(self):
+        r = self.__r
+        if r.shape[0] < self.__width + 1:
+            r = np.vstack([r, np.zeros((self.__width + 1 - r.shape[0], r.shape[1]))])
+        return r
+
+    # (coefficients, intercept). With ridge > 0 the coefficients (not the intercept) are penalised by
+    # ridge * |coefficients|^2. If the triangular factor is worse conditioned than max_condition the
+    # minimum-norm solution is used instead of back substitution.
+    def solve(self, ridge=0.0, max_condition=1e10):
+        if self.rows == 0:
+            raise Exception("No samples to fit")
+        width = self.__width
+        r = self.__square_r()
+        if ridge > 0:
+            penalty = np.zeros((self.n_features, width + 1))
+            penalty[:, :self.n_features] = np.sqrt(ridge) * np.eye(self.n_features)
+            r = np.linalg.qr(np.vstack([r, penalty]), mode='r')
+        triangle = r[:width, :width]
+        self.condition = _condition(triangle)
+        if self.condition <= max_condition:
+            solution = solve_triangular(triangle, r[:width, width])
+            self.rank = width
+        else:
+            solution, _, self.rank, _ = np.linalg.lstsq(triangle, r[:width, width], rcond=1 / max_condition)
+        self.__solution = solution
+        coefficients = solution[:self.n_features]
+        intercept = 0.0
+        if self.fit_intercept:
+            intercept = self.__y_shift + float(solution[self.n_features]) - float(self.__x_shift @ coefficients)
+        return coefficients, intercept
+
+    # Of the last solution, over the samples only (the ridge penalty is not included)
+    def residual_sum_of_squares(self):
+        if self.__solution is None:
+            self.solve()
+        r = self.__square_r()
+        width = self.__width
+        fit_error = r[:width, :width] @ self.__solution - r[:width, width]
+        return float(fit_error @ fit_error + r[width, width] ** 2)
+
+    def total_sum_of_squares(self):
+        if self.rows == 0:
+            return 0.0
+        return self.__y_square_sum - self.__y_sum ** 2 / self.rows
+
+
+# 1-norm condition number estimate of an upper triangular matrix, O(n^2) instead of an SVD
+def _condition(triangle):
+    if triangle.shape[0] == 0:
+        return 1.0
+    if not np.all(np.isfinite(triangle)) or np.any(np.diag(triangle) == 0):
+        return np.inf
+    rcond, info = lapack.dtrcon(triangle, norm='1', uplo='U', diag='N')
+    return 1 / rcond if rcond > 0 else np.inf
@@ -0,0 +1,16 @@
+import pytest
+
+
+# samples_file(header, columns) writes a sample file (header line, then comma-separated rows) to the test's
+# temporary directory and returns its name
+@pytest.fixture
+def samples_file(tmp_path):
+    def write(header, columns, name="samples.csv"):
+        filename = tmp_path / name
+        with open(filename, "w", encoding="utf-8") as f:
+            f.write(",".join(header) + "\n")
+            for row in zip(*columns):
+                f.write(",".join(repr(float(value)) for value in row) + "\n")
+        return str(filename)
+
+    return write
@@ -0,0 +1,25 @@
+import pytest
+
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+
+ASSIGNMENTS = [
+    "0 && (y = 5)",
+    "1 || (y = 5)",
+    "1 && (y = 5)",
+    "0 || (y = 5)",
+    "(x = 3) > 2 && (z = x * 2)",
+    "(x = 1) > 2 && (z = x * 2)",
+    "w = 0 || (v = 4)",
+]
+
+
+@pytest.mark.parametrize("expression", ASSIGNMENTS)
+def test_compiled_assignments_match_evaluator(expression):
+    interpreted = EvaluatorWrapper()
+    compiled = EvaluatorWrapper()
+    result = interpreted.eval(expression)
+    assert compiled.eval_compiled(compiled.compile(expression)) == result
+    assert compiled.get_variables() == interpreted.get_variables()
+    assert None not in compiled.get_variables().values()
+    # Skipped assignments must not leave anything behind that breaks other evaluation paths
+    compiled.eval_vectorized("pi", {})
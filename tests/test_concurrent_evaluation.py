@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+
+FORMULA = "y = a * x ^ 2 + sqrt(x) / (1 + b)"
+
+
+def test_one_compiled_model_from_many_threads():
+    low = EvaluatorWrapper()
+    low.set_precision(10)
+    high = EvaluatorWrapper()
+    high.set_precision(40)
+    calls = []
+    for ew in (low, high):
+        ew.bind_all({"a": 3, "b": 7})
+        compiled = ew.compile(FORMULA)
+        calls += [(ew, compiled, x) for x in range(2000)]
+    expected = [ew.eval_compiled(compiled, ew.new_environment({"x": x})) for ew, compiled, x in calls]
+
+    def evaluate(call):
+        ew, compiled, x = call
+        environment = ew.new_environment({"x": x})
+        result = ew.eval_compiled(compiled, environment)
+        # The assignment lands in the environment of this call only
+        return result, environment["y"], environment["x"]
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(evaluate, calls))
+    for (result, assigned, x), value, (_, _, given) in zip(results, expected, calls):
+        assert result == value == assigned
+        assert x == given
+    # Both precisions were in use at the same time without affecting each other
+    assert len(str(expected[2])) < len(str(expected[2002]))
+    assert "y" not in low.get_variables() and "y" not in high.get_variables()
@@ -0,0 +1,34 @@
+import pytest
+
+from expression_processor.differentiator import Differentiator
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+from expression_processor.numeric_backend import NumericMode
+
+POINT = {"x": 1.7, "y": 2.3}
+
+
+@pytest.mark.parametrize("expression", [
+    # Powers: constant exponent, variable exponent and both
+    "x ^ 3", "(2 * x + 1) ^ 0.5", "2 ^ x", "y ^ (x * x)", "x ^ x",
+    # Functions and roots
+    "sqrt(x * y)", "√(x + 1)", "abs(1 - x)", "ln(x ^ 2)", "exp(-x / y)", "sum(x, x ^ 2, y)",
+    # Products, quotients, negation
+    "x * y * x", "(x ^ 2 + 1) / (x - 3)", "y / x", "-x / (1 + x * x)", "x - y * x",
+])
+def test_derivative_matches_finite_difference(expression):
+    ew = EvaluatorWrapper(numeric_mode=NumericMode.FLOAT)
+    tree = ew.parse(expression)
+    function = ew.compile(tree)
+    derivative = ew.compile(Differentiator("x").derivative(tree))
+
+    def value(compiled, x):
+        return float(ew.eval_compiled(compiled, ew.new_environment(dict(POINT, x=x))))
+
+    step = 1e-6
+    expected = (value(function, POINT["x"] + step) - value(function, POINT["x"] - step)) / (2 * step)
+    assert value(derivative, POINT["x"]) == pytest.approx(expected, rel=1e-6, abs=1e-8)
+
+
+def test_derivative_of_unrelated_expression_is_zero():
+    ew = EvaluatorWrapper(numeric_mode=NumericMode.FLOAT)
+    assert ew.eval_compiled(ew.compile(Differentiator("x").derivative(ew.parse("y ^ 2 + ln(y)")))) == 0
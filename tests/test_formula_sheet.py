@@ -0,0 +1,61 @@
+from expression_processor.formula_sheet import FormulaSheet
+
+
+def _errors(formulas):
+    sheet = FormulaSheet()
+    sheet.set_formulas(formulas)
+    sheet.update()
+    return [sheet.cell(i).error for i in range(len(sheet))]
+
+
+def test_sheet_errors_are_in_russian():
+    assert _errors(["a = 1", "a = 2"]) == ["Переменная 'a' присваивается в нескольких формулах"] * 2
+    assert _errors(["a = b + 1", "b = a + 1", "c = a"]) == ["Циклическая зависимость через b",
+                                                            "Циклическая зависимость через a",
+                                                            "Переменная 'a' не определена"]
+    assert _errors(["x = y + 1"]) == ["Переменная 'y' не определена"]
+
+
+def test_skipped_assignment_in_sheet():
+    sheet = FormulaSheet()
+    sheet.set_formulas(["0 && (y = 5)", "y + 1"])
+    sheet.update()
+    assert sheet.cell(0).error is None and sheet.cell(0).assigned == {}
+    assert sheet.cell(1).error == "Переменная 'y' не определена"
+
+
+def _chain_sheet():
+    sheet = FormulaSheet()
+    sheet.set_formulas(["a = 1", "b = a + 1", "c = 5", "d = b * 2", "e = c + 1"])
+    assert sheet.update() == [0, 1, 2, 3, 4]
+    return sheet
+
+
+def test_update_re_evaluates_edited_formula_and_its_readers():
+    sheet = _chain_sheet()
+    assert sheet.update() == []
+    sheet.set_formula(0, "a = 2")
+    assert sheet.update() == [0, 1, 3]
+    assert sheet.cell(3).value == 6
+    sheet.set_formula(4, "e = c + 2")
+    assert sheet.update() == [4]
+
+
+def test_update_stops_where_assigned_values_do_not_change():
+    sheet = _chain_sheet()
+    sheet.set_formula(0, "a = 4 / 4")
+    assert sheet.update() == [0]
+    # b keeps its value, so d is not re-evaluated
+    sheet.set_formula(1, "b = a * 2")
+    assert sheet.update() == [1]
+
+
+def test_update_when_a_cycle_appears_and_goes_away():
+    sheet = _chain_sheet()
+    sheet.set_formula(0, "a = d - 5")
+    assert sheet.update() == [0, 1, 3]
+    assert [sheet.cell(i).error is not None for i in range(5)] == [True, True, False, True, False]
+    sheet.set_formula(0, "a = 3")
+    assert sheet.update() == [0, 1, 3]
+    assert [sheet.cell(i).error for i in range(5)] == [None] * 5
+    assert sheet.cell(3).value == 8
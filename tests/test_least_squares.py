@@ -0,0 +1,38 @@
+import numpy as np
+
+from samples_processor.least_squares import solve_least_squares
+
+
+# Two columns that differ by ~1e-8 of their size: cond(x) ~ 1e8, so cond(x'x) ~ 1e16 is out of reach of the
+# normal equations
+def _collinear_design(rows=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    x1 = rng.normal(size=rows)
+    x2 = x1 + 1e-8 * rng.normal(size=rows)
+    x = np.column_stack([x1, x2])
+    y = x @ np.array([1.0, 2.0]) + 3.0
+    return x, y
+
+
+def test_cholesky_falls_back_to_qr_on_collinear_design():
+    x, y = _collinear_design()
+    qr = solve_least_squares(x, y, method="qr")
+    cholesky = solve_least_squares(x, y, method="cholesky")
+    assert qr.condition > 1e7
+    np.testing.assert_allclose(qr.coefficients, [1.0, 2.0], rtol=1e-5)
+    np.testing.assert_allclose(cholesky.coefficients, qr.coefficients, rtol=1e-6)
+    assert abs(cholesky.intercept - 3.0) < 1e-6
+
+
+def test_condition_is_condition_of_design_for_every_method():
+    rng = np.random.default_rng(1)
+    x = rng.normal(size=(500, 3)) * np.array([1.0, 10.0, 100.0])
+    y = x @ np.array([1.0, -1.0, 0.5]) + 2.0
+    qr = solve_least_squares(x, y, method="qr")
+    cholesky = solve_least_squares(x, y, method="cholesky")
+    assert cholesky.method == "cholesky"
+    singular_values = np.linalg.svd(x - x.mean(axis=0), compute_uv=False)
+    exact = singular_values[0] / singular_values[-1]
+    for solution in (qr, cholesky):
+        assert exact / 10 < solution.condition < exact * 10
+    np.testing.assert_allclose(cholesky.coefficients, qr.coefficients, rtol=1e-9)
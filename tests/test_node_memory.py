@@ -0,0 +1,31 @@
+import gc
+import tracemalloc
+
+from expression_processor.expressionizer import VariableExpression, walk
+from expression_processor.precedence_parser import PrecedenceExpressionizer
+from expression_processor.tokenizer import FastTokenizer
+
+# Peak bytes per node of tokenizing and parsing the model below. Recorded on this model with tracemalloc:
+# 213 before tokens and nodes got __slots__ and shared operator tokens (239.4 MB for 1.12M nodes), 84 after.
+_UNSLOTTED_PEAK_PER_NODE = 213
+_PEAK_PER_NODE = 120
+
+
+def test_peak_memory_of_a_million_node_model():
+    source = " + ".join(f"(L{i % 100} / D{i % 100}) ^ 2 * k{i % 100}" for i in range(125000))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tree = PrecedenceExpressionizer(FastTokenizer(source).parse_tokens()).parse_expression()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    nodes = list(walk(tree))
+    assert len(nodes) > 1000000
+    assert peak / len(nodes) < _PEAK_PER_NODE < _UNSLOTTED_PEAK_PER_NODE
+    assert not any(hasattr(node, "__dict__") for node in nodes)
+
+    # Identifier lexemes are interned, so every variable of one name shares a single string
+    by_name = {}
+    for node in (node for node in nodes if isinstance(node, VariableExpression)):
+        assert by_name.setdefault(node.name.lexeme, node.name.lexeme) is node.name.lexeme
@@ -0,0 +1,15 @@
+import numpy as np
+
+from samples_processor.nonlinear_fitting import fit_mnk_nonlinear
+
+
+def test_power_law_is_recovered(samples_file):
+    rng = np.random.default_rng(0)
+    v = rng.uniform(1, 10, size=500)
+    y = 2.5 * v ** 0.7 * (1 + 1e-4 * rng.normal(size=len(v)))
+    filename = samples_file(["V", "y"], [v, y])
+
+    fit = fit_mnk_nonlinear(filename, "y = a0 * V ^ a1")
+    assert fit.converged
+    assert fit.coefficient_names == ["a0", "a1"]
+    np.testing.assert_allclose(fit.coefficients, [2.5, 0.7], rtol=1e-3)
@@ -0,0 +1,21 @@
+import math
+from decimal import Decimal
+
+import pytest
+
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+from expression_processor.numeric_backend import NumericMode
+
+
+@pytest.mark.parametrize("expression", ["0 + (-0 + x)", "x + 0", "0 + x", "x - -0", "(-0) - -0 + x * 1"])
+@pytest.mark.parametrize("numeric_mode", [NumericMode.FLOAT, NumericMode.DECIMAL])
+def test_optimizer_keeps_the_sign_of_zero(expression, numeric_mode):
+    plain = EvaluatorWrapper(numeric_mode=numeric_mode)
+    optimized = EvaluatorWrapper(numeric_mode=numeric_mode, optimize=True)
+    zero = -0.0 if numeric_mode == NumericMode.FLOAT else Decimal("-0")
+    for ew in (plain, optimized):
+        ew.bind("x", zero)
+    expected = plain.eval(expression)
+    result = optimized.eval(expression)
+    assert result == expected
+    assert math.copysign(1, result) == math.copysign(1, expected)
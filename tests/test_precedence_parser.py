@@ -0,0 +1,20 @@
+import pytest
+
+from expression_processor.evaluator_wrapper import EvaluatorWrapper
+from expression_processor.numeric_backend import NumericMode
+from expression_processor.precedence_parser import ParserMode
+
+
+def test_balanced_long_chain_evaluates():
+    expression = " + ".join(["x"] * 20000) + " * 2"
+    ew = EvaluatorWrapper(numeric_mode=NumericMode.FLOAT, parser_mode=ParserMode.PRECEDENCE, balance_chains=True)
+    ew.bind("x", 0.5)
+    assert ew.eval(expression) == 10000.5
+    compiled = ew.compile(expression)
+    assert ew.eval_compiled(compiled) == 10000.5
+
+
+def test_balance_chains_needs_precedence_parser():
+    ew = EvaluatorWrapper(balance_chains=True)
+    with pytest.raises(Exception, match="PRECEDENCE"):
+        ew.eval("1 + 2 + 3")
@@ -0,0 +1,18 @@
+import numpy as np
+
+from samples_processor.resampling import resample_mnk
+
+
+def test_resampling_collinear_design(samples_file):
+    rng = np.random.default_rng(0)
+    rows = 400
+    x1 = rng.uniform(1, 2, size=rows)
+    x2 = x1 + 1e-8 * rng.normal(size=rows)
+    y = 1.0 * x1 + 2.0 * x2 + 3.0
+    filename = samples_file(["x1", "x2", "y"], [x1, x2, y])
+
+    result = resample_mnk(filename, "y = a0 * x1 + a1 * x2 + a2", bootstraps=50, folds=5, seed=1)
+    np.testing.assert_allclose(result.estimates, [1.0, 2.0, 3.0], rtol=1e-4)
+    # Every bootstrap refit recovers the exact coefficients, so the intervals are tight around them
+    np.testing.assert_allclose(result.replicates, np.tile([1.0, 2.0, 3.0], (50, 1)), rtol=1e-4)
+    assert result.cv_rmse < 1e-6
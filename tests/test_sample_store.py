@@ -0,0 +1,44 @@
+import threading
+
+import numpy as np
+import pytest
+
+from samples_processor.sample_store import load_samples
+
+
+def test_cache_matches_text(tmp_path):
+    filename = tmp_path / "samples.csv"
+    filename.write_text("# comment\nx1,y\n1,2\n\n3,4\n  \n5,6\n", encoding="utf-8")
+    store = load_samples(str(filename))
+    np.testing.assert_array_equal(store.data, [[1, 2], [3, 4], [5, 6]])
+
+
+# A no-break space line is a row to the byte scan but blank as text, a lone \r the other way round
+@pytest.mark.parametrize("text", ["x1,y\n1,2\n\u00a0\n3,4\n", "x1,y\n1,2\r3,4\n"])
+def test_rows_the_passes_disagree_on_are_rejected(tmp_path, text):
+    filename = tmp_path / "samples.csv"
+    filename.write_bytes(text.encode("utf-8"))
+    with pytest.raises(Exception, match="Expected [0-9]+ rows"):
+        load_samples(str(filename))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["samples.csv"]
+
+
+def test_concurrent_loads_all_get_the_cache(samples_file, tmp_path):
+    columns = [np.arange(50000.0), np.arange(50000.0) * 2]
+    filename = samples_file(["x1", "y"], columns)
+    barrier = threading.Barrier(3)
+    stores = []
+
+    def load():
+        barrier.wait()
+        stores.append(load_samples(filename, chunk_rows=1000))
+
+    threads = [threading.Thread(target=load) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [store.cached for store in stores] == [True] * 3
+    for store in stores:
+        np.testing.assert_array_equal(store.data, np.column_stack(columns))
+    assert not [path.name for path in tmp_path.iterdir() if path.name.endswith(".tmp")]
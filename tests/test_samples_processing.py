@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from samples_processor.samples_processing import fit_mnk
+
+
+class _Stop(Exception):
+    pass
+
+
+def _linear_samples(samples_file, rows):
+    rng = np.random.default_rng(0)
+    x1 = rng.uniform(1, 2, size=rows)
+    x2 = rng.uniform(1, 2, size=rows)
+    return samples_file(["x1", "x2", "y"], [x1, x2, 2 * x1 + 3 * x2 + 1])
+
+
+def test_streaming_progress_grows_with_the_rows_read(samples_file):
+    filename = _linear_samples(samples_file, 20000)
+    reported = []
+    model = fit_mnk(filename, "y = a0 * x1 + a1 * x2 + a2", streaming=True, chunk_rows=1000,
+                    progress=reported.append)
+    np.testing.assert_allclose(model.coefficients, [2, 3], rtol=1e-8)
+    assert reported == sorted(reported)
+    assert reported[-1] == 100
+    # One report per chunk, spread over the streaming stage rather than stuck at one value
+    streaming = [percent for percent in reported if 10 < percent <= 80]
+    assert len(set(int(percent) for percent in streaming)) > 10
+
+
+def test_streaming_fit_passes_on_abort_from_progress(samples_file):
+    filename = _linear_samples(samples_file, 5000)
+
+    def progress(percent):
+        if percent > 10:
+            raise _Stop()
+
+    with pytest.raises(_Stop):
+        fit_mnk(filename, "y = a0 * x1 + a1 * x2 + a2", streaming=True, chunk_rows=1000, progress=progress)
@@ -0,0 +1,30 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+# Seconds for "import qt_gui.gui" in a fresh interpreter; it takes about 0.15 s without the numeric stack
+_IMPORT_BUDGET = 1.0
+
+_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import qt_gui.gui
+elapsed = time.perf_counter() - started
+print(json.dumps({"elapsed": elapsed, "loaded": [name for name in ("numpy", "scipy", "matplotlib")
+                                                 if name in sys.modules]}))
+"""
+
+
+def test_gui_import_skips_numeric_stack():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = dict(os.environ, PYTHONPATH=root, QT_QPA_PLATFORM="offscreen")
+    output = subprocess.run([sys.executable, "-c", _PROBE], cwd=root, env=environment, capture_output=True,
+                            text=True, check=True).stdout
+    probe = json.loads(output.strip().splitlines()[-1])
+    assert probe["loaded"] == []
+    assert probe["elapsed"] < _IMPORT_BUDGET
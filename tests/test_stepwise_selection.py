@@ -0,0 +1,21 @@
+import numpy as np
+
+from samples_processor.stepwise_selection import stepwise_mnk
+
+
+def test_terms_are_judged_on_all_rows(samples_file):
+    rng = np.random.default_rng(0)
+    rows = 6000
+    x1 = rng.uniform(1, 2, size=rows)
+    # 1/x2 is infinite on the last row only, and x3 is constant on the first 5000 rows
+    x2 = rng.uniform(1, 2, size=rows)
+    x2[-1] = 0.0
+    x3 = np.ones(rows)
+    x3[5000:] = rng.uniform(1, 2, size=rows - 5000)
+    y = 2 * x1 + 3 * x3 + 1
+    filename = samples_file(["x1", "x2", "x3", "y"], [x1, x2, x3, y])
+
+    result = stepwise_mnk(filename, library=["x1", "1 / x2", "x3"], chunk_rows=1000)
+    assert sorted(result.terms) == ["x1", "x3"]
+    coefficients = dict(zip(result.terms, result.coefficients))
+    np.testing.assert_allclose([coefficients["x1"], coefficients["x3"], result.intercept], [2, 3, 1], rtol=1e-6)